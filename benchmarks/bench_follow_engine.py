@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+跟踪引擎基准测试 - thread vs asyncio
+
+在本地启动一个模拟 history.json 的 HTTP 服务（带固定延迟模拟网络往返），
+分别用线程引擎和 asyncio 引擎跟踪 10/100/1000 个策略，统计:
+- 峰值线程数
+- 内存峰值 (tracemalloc)
+- 实际轮询次数与期望轮询次数
+- 轮询间隔漂移（实际间隔与设定间隔之差的平均值）
+
+用法: python benchmarks/bench_follow_engine.py [--duration 10] [--interval 2] [--latency 0.05]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from xq_follower import XueQiuFollower
+from utils import logger, RateLimiter
+
+
+class MockHistoryServer:
+    """模拟 rebalancing/history.json，记录每个组合的请求时间"""
+
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.hits = defaultdict(list)
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                symbol = query.get("cube_symbol", [""])[0]
+                with server._lock:
+                    server.hits[symbol].append(time.monotonic())
+                time.sleep(server.latency)
+                body = json.dumps({"count": 0, "page": 1, "list": []}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = "http://127.0.0.1:%d/cubes/rebalancing/history.json" % self.httpd.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def reset(self):
+        with self._lock:
+            self.hits.clear()
+
+    def shutdown(self):
+        self.httpd.shutdown()
+
+
+class BenchFollower(XueQiuFollower):
+    """指向本地模拟服务的跟踪端，不访问雪球"""
+
+    def __init__(self, api_url):
+        # 基准测试只访问本地服务，关闭限流
+        super().__init__(rate_limiter=RateLimiter(enabled=False))
+        self.TRANSACTION_API = api_url
+
+    def _extract_strategy_name(self, strategy_url):
+        return strategy_url
+
+
+def run_engine(server, engine, n_strategies, duration, interval, max_concurrency):
+    server.reset()
+    follower = BenchFollower(server.url)
+    strategies = ["ZH%06d" % i for i in range(n_strategies)]
+
+    peak_threads = [threading.active_count()]
+    stop_sampling = threading.Event()
+
+    def sample_threads():
+        while not stop_sampling.wait(0.1):
+            peak_threads[0] = max(peak_threads[0], threading.active_count())
+
+    threading.Thread(target=sample_threads, daemon=True).start()
+    threading.Timer(duration, follower.stop).start()
+
+    tracemalloc.start()
+    follower.follow(
+        strategies=strategies,
+        total_assets=[100000] * n_strategies,
+        initial_assets=[None] * n_strategies,
+        track_interval=interval,
+        cmd_cache=False,
+        engine=engine,
+        max_concurrency=max_concurrency,
+    )
+    _, peak_mem = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stop_sampling.set()
+
+    polls = sum(len(v) for v in server.hits.values())
+    expected = n_strategies * int(duration / interval)
+    drifts = []
+    for times in server.hits.values():
+        for a, b in zip(times, times[1:]):
+            drifts.append(abs((b - a) - interval))
+    avg_drift = sum(drifts) / len(drifts) if drifts else 0.0
+    return {
+        "engine": engine,
+        "strategies": n_strategies,
+        "peak_threads": peak_threads[0],
+        "peak_mem_mb": peak_mem / 1024 / 1024,
+        "polls": polls,
+        "expected": expected,
+        "avg_drift_ms": avg_drift * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="跟踪引擎基准测试")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--interval", type=float, default=2)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--max-concurrency", type=int, default=50)
+    parser.add_argument("--sizes", default="10,100,1000")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    # _add_cmd_to_expired 会在当前目录写缓存文件，切到临时目录避免污染仓库
+    os.chdir(tempfile.mkdtemp(prefix="xq_bench_"))
+
+    server = MockHistoryServer(latency=args.latency)
+    server.start()
+
+    print("%-8s %10s %12s %12s %12s %14s" % ("engine", "strategies", "peak_threads", "peak_mem_mb", "polls/exp", "avg_drift_ms"))
+    try:
+        for size in [int(s) for s in args.sizes.split(",")]:
+            for engine in ("thread", "asyncio"):
+                r = run_engine(server, engine, size, args.duration, args.interval, args.max_concurrency)
+                print("%-8s %10d %12d %12.2f %12s %14.1f" % (
+                    r["engine"], r["strategies"], r["peak_threads"], r["peak_mem_mb"],
+                    "%d/%d" % (r["polls"], r["expected"]), r["avg_drift_ms"]))
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
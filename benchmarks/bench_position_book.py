@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+组合调仓持仓表基准测试 - 持仓列表 vs PositionBook
+
+随机生成持有大量股票的组合快照，统计:
+- 连续调仓：在 trader.position_list 上连续调用 adjust_weight(fetch_position=False)，
+  每次修改一只股票后计算现金并序列化 holdings；PositionBook 在多次调用间保留索引和权重合计
+- 批量调仓：从快照组装持仓、修改多只股票的权重后提交一次（rebalance_to）
+
+列表实现与改动前 XueQiuTrader 的做法一致：按 stock_id 线性查找、每次提交对权重求和。
+单次调仓（adjust_weight(fetch_position=True) / buy / sell）在新快照上只改一只股票，仍使用列表，不在此对比。
+
+用法: python benchmarks/bench_position_book.py [--holdings 50 500 5000] [--updates 100]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from xqtrader import PortfolioSnapshot, PositionBook
+
+
+def make_snapshot(n_holdings, seed=0):
+    rng = random.Random(seed)
+    weight = round(95.0 / n_holdings, 2)
+    holdings = [{
+        "stock_id": 1000 + i, "stock_symbol": "SH%06d" % i, "stock_name": "股票%d" % i,
+        "weight": weight, "segment_name": "行业", "price": round(rng.uniform(2, 200), 2),
+    } for i in range(n_holdings)]
+    info = {"last_rb": {"holdings": holdings, "cash": 100 - weight * n_holdings}, "net_value": 1.0}
+    return PortfolioSnapshot.from_info("ZH000000", info)
+
+
+def list_submit(position_list):
+    cash = round(100 - sum(i.get("weight", 0) for i in position_list), 2)
+    return cash, json.dumps(position_list)
+
+
+def list_set_weight(position_list, stock_id, weight):
+    for position in position_list:
+        if position["stock_id"] == stock_id:
+            position["proactive"] = True
+            position["weight"] = weight
+            break
+
+
+def timed(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="组合调仓持仓表基准测试")
+    parser.add_argument("--holdings", type=int, nargs="+", default=[50, 500, 5000])
+    parser.add_argument("--updates", type=int, default=100, help="连续/批量调仓修改的股票数")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print("%8s %14s %14s %8s %14s %14s %8s" % (
+        "持仓数", "连续-列表(ms)", "连续-索引(ms)", "加速比", "批量-列表(ms)", "批量-索引(ms)", "加速比"))
+    for n_holdings in args.holdings:
+        snapshot = make_snapshot(n_holdings)
+        rng = random.Random(n_holdings)
+        targets = [(1000 + rng.randrange(n_holdings), round(rng.uniform(0, 1), 2)) for _ in range(args.updates)]
+
+        def list_repeated():
+            position_list = snapshot.positions()
+            for stock_id, weight in targets:
+                list_set_weight(position_list, stock_id, weight)
+                list_submit(position_list)
+
+        def book_repeated():
+            book = PositionBook.from_snapshot(snapshot)
+            for stock_id, weight in targets:
+                book.set_weight(stock_id, weight)
+                book.cash, book.to_json()
+
+        def list_many():
+            position_list = snapshot.positions()
+            for stock_id, weight in targets:
+                list_set_weight(position_list, stock_id, weight)
+            list_submit(position_list)
+
+        def book_many():
+            book = PositionBook.from_snapshot(snapshot)
+            for stock_id, weight in targets:
+                book.set_weight(stock_id, weight)
+            book.cash, book.to_json()
+
+        t_list_repeated = timed(list_repeated, args.repeat)
+        t_book_repeated = timed(book_repeated, args.repeat)
+        t_list_many = timed(list_many, args.repeat)
+        t_book_many = timed(book_many, args.repeat)
+        print("%8d %14.3f %14.3f %7.1fx %14.3f %14.3f %7.1fx" % (
+            n_holdings, t_list_repeated * 1000, t_book_repeated * 1000, t_list_repeated / t_book_repeated,
+            t_list_many * 1000, t_book_many * 1000, t_list_many / t_book_many))
+
+
+if __name__ == "__main__":
+    main()
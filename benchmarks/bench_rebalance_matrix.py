@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+调仓计划基准测试 - 逐个 RebalancePlan.build vs 矩阵化 RebalanceMatrix
+
+随机生成目标组合、行情和多个模拟仓持仓，统计:
+- 逐个模拟仓调用 RebalancePlan.build 的耗时
+- build_plans（矩阵计算 + 生成 RebalancePlan）的耗时
+- 只做矩阵计算 RebalanceMatrix.solve 的耗时
+
+加速比为 逐个build / build_plans，即实际调用路径的加速。
+
+用法: python benchmarks/bench_rebalance_matrix.py [--symbols 100 1000 5000] [--accounts 1 10 100 500]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from xq_rebalance import RebalancePlan
+from xq_rebalance_matrix import RebalanceMatrix, build_plans
+from utils import InstrumentIndex
+
+
+def make_case(n_symbols, n_accounts, seed=0):
+    rng = random.Random(seed)
+    symbols = ["SH%06d" % i for i in range(n_symbols)]
+    weights = [rng.random() for _ in symbols]
+    scale = 95.0 / sum(weights)
+    target_holdings = [{"symbol": s, "weight": w * scale} for s, w in zip(symbols, weights)]
+    quotes = {
+        s: {"name": s + ("转债" if i % 10 == 0 else ""), "current": round(rng.uniform(2, 200), 2)}
+        for i, s in enumerate(symbols)
+    }
+    snapshots = {}
+    for gid in range(n_accounts):
+        held = rng.sample(symbols, min(n_symbols, 50))
+        snapshots[gid] = {
+            "performance": {"assets": rng.uniform(1e6, 1e8), "cash": 1e5},
+            "holdings": [{"symbol": s, "name": s, "shares": rng.randrange(0, 5000, 100),
+                          "current": quotes[s]["current"]} for s in held],
+        }
+    return target_holdings, quotes, snapshots
+
+
+def timed(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="调仓计划基准测试")
+    parser.add_argument("--symbols", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--accounts", type=int, nargs="+", default=[1, 10, 100, 500])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print("%8s %8s %14s %14s %14s %8s" % ("股票数", "模拟仓数", "逐个build(ms)", "build_plans(ms)", "solve(ms)", "加速比"))
+    for n_symbols in args.symbols:
+        for n_accounts in args.accounts:
+            target_holdings, quotes, snapshots = make_case(n_symbols, n_accounts)
+            gids = list(snapshots)
+            # 随机生成的代码只放在内存索引中，不写入任何数据库
+            instruments = InstrumentIndex()
+
+            def loop():
+                for gid in gids:
+                    RebalancePlan.build(gid, "ZH", snapshots[gid]["performance"], snapshots[gid]["holdings"],
+                                        target_holdings, 5, quotes, instruments=instruments)
+
+            def matrix_plans():
+                build_plans(gids, "ZH", snapshots, target_holdings, 5, quotes, instruments=instruments)
+
+            matrix, _ = RebalanceMatrix.from_target(
+                target_holdings, quotes, [h["symbol"] for s in snapshots.values() for h in s["holdings"]], instruments)
+            shares, held_prices = matrix.shares_matrix([snapshots[gid]["holdings"] for gid in gids])
+            assets = [snapshots[gid]["performance"]["assets"] for gid in gids]
+
+            def solve():
+                matrix.solve(assets, shares, held_prices=held_prices)
+
+            t_loop = timed(loop, args.repeat)
+            t_plans = timed(matrix_plans, args.repeat)
+            t_solve = timed(solve, args.repeat)
+            print("%8d %8d %14.2f %14.2f %14.2f %7.1fx" % (
+                n_symbols, n_accounts, t_loop * 1000, t_plans * 1000, t_solve * 1000, t_loop / t_plans))
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,7 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from xq_simulator import XueQiuSimulator
+from utils import PollScheduler, TradingCalendar
 
 
 def load_config():
@@ -29,6 +30,12 @@ def main():
     target_code = config.get("target_portfolio_code", "ZH1783962")
     interval = config.get("track_interval", 30)  # 默认30秒
     
+    # 开启 adaptive_poll 后按交易时段调整轮询频率，休市时暂停轮询
+    scheduler = None
+    if config.get("adaptive_poll"):
+        calendar = TradingCalendar(config.get("trading_holidays", []))
+        scheduler = PollScheduler(session_interval=interval, calendar=calendar)
+    
     print("=" * 60)
     print("雪球自动跟踪同步")
     print("=" * 60)
@@ -45,7 +52,8 @@ def main():
         gid=gid,
         portfolio_code=target_code,
         interval=interval,
-        max_iterations=None  # 无限循环，按 Ctrl+C 停止
+        max_iterations=None,  # 无限循环，按 Ctrl+C 停止
+        scheduler=scheduler,
     )
 
 
@@ -85,8 +85,9 @@ def main():
     print("\n【5】我创建的组合详情:")
     try:
         my_portfolios = trader.get_my_portfolios()
+        portfolios = trader.get_public_portfolios(my_portfolios)
         for code in my_portfolios:
-            info = trader.get_public_portfolio(code)
+            info = portfolios.get(code)
             if info:
                 print(f"\n  组合: {code}")
                 print(f"  净值: {info.get('net_value', 0)}")
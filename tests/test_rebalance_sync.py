@@ -4,6 +4,7 @@
 
 模拟场景：检测到跟踪组合发生调仓变化，自动同步到模拟仓
 """
+import argparse
 import json
 import os
 import sys
@@ -12,6 +13,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from xq_simulator import XueQiuSimulator
 from utils import logger
+from utils.replay import load_manifest, save_manifest
 
 
 def load_config():
@@ -20,14 +22,25 @@ def load_config():
         return json.load(f)
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="模拟调仓变化测试")
+    parser.add_argument("--replay", metavar="DIR", help="从录制的接口数据回放，不访问网络（如 tests/fixtures/sync_basic）")
+    parser.add_argument("--record", metavar="DIR", help="把本次访问的接口数据录制到目录")
+    parser.add_argument("--dry-run", action="store_true", help="只生成调仓计划，不实际下单")
+    return parser.parse_args()
+
+
 def main():
-    config = load_config()
+    args = parse_args()
+    config = load_manifest(args.replay) if args.replay else load_config()
     
-    simulator = XueQiuSimulator()
+    simulator = XueQiuSimulator(dry_run=args.dry_run, replay_dir=args.replay, record_dir=args.record)
     simulator.login()
     
     gid = config.get("simulator_gid", 6522325211190960)
     target_code = config.get("target_portfolio_code", "ZH1783962")
+    if args.record:
+        save_manifest(args.record, {"simulator_gid": gid, "target_portfolio_code": target_code})
     
     print("=" * 60)
     print("模拟调仓变化检测测试")
@@ -1,6 +1,17 @@
 # -*- coding: utf-8 -*-
 from utils.log import logger
 from utils.misc import parse_cookies_str
+from utils.cmd_journal import CmdJournal
+from utils.cmd_index import ExpiredCmdIndex
+from utils.scheduler import TradingCalendar, FixedScheduler, PollScheduler
+from utils.rate_limit import RateLimiter, RateLimitedSession, get_default_limiter
+from utils.quote_cache import QuoteCache, get_default_quote_cache
+from utils.instrument_index import InstrumentIndex, get_default_instrument_index
+from utils.pager import PageIterator
 
-__all__ = ["logger", "parse_cookies_str"]
+__all__ = ["logger", "parse_cookies_str", "CmdJournal", "ExpiredCmdIndex",
+           "TradingCalendar", "FixedScheduler", "PollScheduler",
+           "RateLimiter", "RateLimitedSession", "get_default_limiter",
+           "QuoteCache", "get_default_quote_cache",
+           "InstrumentIndex", "get_default_instrument_index", "PageIterator"]
 
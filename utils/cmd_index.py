@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+已执行指令索引
+
+以指令键的 8 字节哈希为键、指令时间为值，配合最小堆按时间淘汰：
+- 成员判断是一次字典查找
+- 早于保留期限的记录自动淘汰，条目数另有上限，内存不随运行时间增长
+"""
+import hashlib
+import heapq
+import re
+import threading
+import time
+from datetime import datetime
+
+_KEY_TIME_PATTERN = re.compile(r"_(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})$")
+
+
+class ExpiredCmdIndex:
+    """
+    有界、按时间淘汰的指令键索引
+
+    :param horizon: 保留期限（秒），指令时间早于 now - horizon 的记录被淘汰
+    :param max_entries: 最大条目数，超出时淘汰最旧的记录
+    """
+
+    def __init__(self, horizon=7 * 24 * 3600, max_entries=100000):
+        self.horizon = horizon
+        self.max_entries = max_entries
+        self._entries = {}
+        self._heap = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(key: str) -> int:
+        """指令键的定长哈希"""
+        return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+    def __contains__(self, key) -> bool:
+        return self.digest(key) in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def is_stale(self, timestamp, now=None) -> bool:
+        """指令时间是否已超出保留期限"""
+        if now is None:
+            now = time.time()
+        return timestamp < now - self.horizon
+
+    def add(self, key, timestamp) -> int:
+        """添加指令键，返回其哈希"""
+        digest = self.digest(key)
+        self.add_digest(digest, timestamp)
+        return digest
+
+    def add_digest(self, digest, timestamp):
+        with self._lock:
+            self._entries[digest] = timestamp
+            heapq.heappush(self._heap, (timestamp, digest))
+            self._evict(time.time())
+
+    def evict(self, now=None):
+        """淘汰过期记录"""
+        with self._lock:
+            self._evict(time.time() if now is None else now)
+
+    def _evict(self, now):
+        cutoff = now - self.horizon
+        while self._heap and (self._heap[0][0] < cutoff or len(self._entries) > self.max_entries):
+            timestamp, digest = heapq.heappop(self._heap)
+            # 同一哈希被重新加入时堆中会留下旧时间的条目，只有时间一致才真正删除
+            if self._entries.get(digest) == timestamp:
+                del self._entries[digest]
+        # 惰性删除积累的堆条目过多时重建
+        if len(self._heap) > 2 * len(self._entries) + 1024:
+            self._heap = [(t, d) for d, t in self._entries.items()]
+            heapq.heapify(self._heap)
+
+    def records(self) -> list:
+        """导出 [哈希, 时间] 记录，用于持久化"""
+        with self._lock:
+            return [[digest, timestamp] for digest, timestamp in self._entries.items()]
+
+    def load_records(self, records):
+        """
+        从持久化记录恢复
+
+        兼容旧版缓存中的完整指令键字符串，时间从键尾部的 datetime 解析
+        """
+        now = time.time()
+        with self._lock:
+            for record in records:
+                if isinstance(record, str):
+                    match = _KEY_TIME_PATTERN.search(record)
+                    if match is None:
+                        continue
+                    timestamp = datetime.strptime(match.group(1), "%Y-%m-%d %H:%M:%S").timestamp()
+                    digest = self.digest(record)
+                else:
+                    digest, timestamp = record
+                self._entries[digest] = timestamp
+                self._heap.append((timestamp, digest))
+            heapq.heapify(self._heap)
+            self._evict(now)
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+指令缓存日志
+
+快照 + 追加日志的持久化方式：
+- 每条新记录只向日志文件追加一行，按批次 fsync
+- 日志行数超过阈值时压缩为快照（先写临时文件再原子替换），随后清空日志
+- 启动时先读快照再重放日志，末尾写了一半的记录会被丢弃，不影响之前的记录
+"""
+import json
+import os
+import pickle
+import threading
+import time
+
+from utils.log import logger
+
+
+class CmdJournal:
+    """
+    指令缓存记录的追加日志
+
+    :param snapshot_path: 快照文件路径（pickle 格式，兼容旧版 cmd_cache.pk 中的指令键集合）
+    :param journal_path: 日志文件路径，默认在快照路径后加 .journal
+    :param fsync_batch: 累计多少条记录后 fsync 一次
+    :param fsync_interval: 距上次 fsync 超过多少秒后下一次写入时 fsync
+    :param compact_threshold: 日志记录数超过该值时压缩为快照
+    """
+
+    def __init__(self, snapshot_path, journal_path=None, fsync_batch=32,
+                 fsync_interval=1.0, compact_threshold=10000):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path or snapshot_path + ".journal"
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.compact_threshold = compact_threshold
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._records = 0
+        self._pending = 0
+        self._last_fsync = time.monotonic()
+
+    def load(self) -> list:
+        """读取快照并重放日志，按写入顺序返回全部记录"""
+        records = []
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, "rb") as f:
+                    records = list(pickle.load(f))
+            except Exception as e:
+                logger.warning("加载指令缓存快照失败: %s", e)
+
+        count, valid_size = self._replay(records)
+        with self._lock:
+            self._records = count
+            self._open_journal(valid_size)
+        return records
+
+    def _replay(self, records):
+        """重放日志，返回 (有效记录数, 有效字节数)"""
+        if not os.path.exists(self.journal_path):
+            return 0, 0
+
+        count = 0
+        valid_size = 0
+        with open(self.journal_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+                count += 1
+                valid_size += len(line)
+
+        if valid_size < os.path.getsize(self.journal_path):
+            logger.warning("指令缓存日志末尾存在不完整记录，已丢弃")
+        return count, valid_size
+
+    def _open_journal(self, valid_size=None):
+        if self._file is not None:
+            return
+        self._file = open(self.journal_path, "ab")
+        # 截掉崩溃时写了一半的尾部记录，保证后续追加从完整行开始
+        if valid_size is not None and self._file.tell() > valid_size:
+            self._file.truncate(valid_size)
+            self._file.seek(valid_size)
+
+    def append(self, record):
+        """追加一条记录（任意可 JSON 序列化的值）"""
+        line = json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+        with self._lock:
+            self._open_journal()
+            self._file.write(line)
+            self._file.flush()
+            self._records += 1
+            self._pending += 1
+            if (self._pending >= self.fsync_batch
+                    or time.monotonic() - self._last_fsync >= self.fsync_interval):
+                self._fsync()
+
+    @property
+    def should_compact(self) -> bool:
+        return self._records >= self.compact_threshold
+
+    def compact(self, records):
+        """将全部记录写成快照并清空日志"""
+        tmp_path = self.snapshot_path + ".tmp"
+        with self._lock:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(list(records), f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+
+            # 快照落盘后才清空日志；两步之间崩溃只会导致重复重放，不会丢键
+            self._open_journal()
+            self._file.truncate(0)
+            self._file.seek(0)
+            self._fsync()
+            self._records = 0
+
+    def flush(self):
+        """将未 fsync 的记录落盘"""
+        with self._lock:
+            if self._file is not None and self._pending:
+                self._fsync()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._fsync()
+                self._file.close()
+                self._file = None
+
+    def _fsync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_fsync = time.monotonic()
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+证券元数据索引
+
+股票代码 -> 证券类型、每手股数、交易所、最小价格变动单位：
+- 沪深北 A 股、可转债、场内基金按代码规则直接判断，不需要请求
+- 其他代码（港股、美股等）从行情或搜索接口返回的信息中学习，之后不再请求
+- 提供 db_path 时学到的条目持久化到 SQLite（默认 data/instruments.db，不与 Web 后台共用数据库），
+  超过 refresh_ttl 后在下次 resolve 时重新获取
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from utils.log import logger
+
+# (交易所, 代码前缀, 证券类型, 每手股数, 最小变动单位)，按顺序匹配
+CODE_RULES = (
+    ("SH", ("110", "111", "113", "118"), "convertible_bond", 10, 0.001),
+    ("SZ", ("123", "127", "128"), "convertible_bond", 10, 0.001),
+    ("SH", ("5",), "fund", 100, 0.001),
+    ("SZ", ("15", "16"), "fund", 100, 0.001),
+    ("SH", ("6",), "stock", 100, 0.01),
+    ("SZ", ("00", "30"), "stock", 100, 0.01),
+    ("BJ", ("4", "8", "9"), "stock", 100, 0.01),
+)
+
+DEFAULT_LOT = 100
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "instruments.db")
+
+
+class InstrumentIndex:
+    """
+    证券元数据索引
+
+    :param db_path: SQLite 数据库路径，提供时持久化学到的条目
+    :param refresh_ttl: 从接口学到的条目的有效期（秒）
+    """
+
+    def __init__(self, db_path=None, refresh_ttl=7 * 24 * 3600):
+        self.db_path = db_path
+        self.refresh_ttl = refresh_ttl
+        # symbol -> {"symbol", "type", "lot", "exchange", "tick", "updated_at"}
+        self._entries = {}
+        self._lock = threading.Lock()
+        if db_path:
+            self._load_from_db()
+
+    @staticmethod
+    def _key(symbol):
+        return str(symbol).upper()
+
+    @staticmethod
+    def classify(symbol):
+        """按代码规则判断沪深北证券，无法判断时返回 None"""
+        key = InstrumentIndex._key(symbol)
+        exchange, code = key[:2], key[2:]
+        if not code.isdigit() or len(code) != 6:
+            return None
+        for rule_exchange, prefixes, kind, lot, tick in CODE_RULES:
+            if exchange == rule_exchange and code.startswith(prefixes):
+                return {"symbol": key, "type": kind, "lot": lot, "exchange": exchange, "tick": tick}
+        return None
+
+    @staticmethod
+    def from_stock_info(symbol, stock_info):
+        """从行情或搜索接口返回的股票信息推断元数据，信息为空时返回 None"""
+        if not stock_info:
+            return None
+        key = InstrumentIndex._key(symbol)
+        name = stock_info.get("name") or ""
+        if key[:2] in ("SH", "SZ", "BJ"):
+            exchange = key[:2]
+        elif key.isdigit():
+            exchange = "HK"
+        else:
+            exchange = "US"
+        kind = "convertible_bond" if "转债" in name else "stock"
+        lot = stock_info.get("lot_size") or (10 if kind == "convertible_bond" else DEFAULT_LOT)
+        tick = stock_info.get("tick_size") or (0.001 if kind == "convertible_bond" else 0.01)
+        return {"symbol": key, "type": kind, "lot": int(lot), "exchange": exchange, "tick": float(tick)}
+
+    def get(self, symbol):
+        """查询本地条目，不发请求；未知代码返回 None"""
+        key = self._key(symbol)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            return entry
+        entry = self.classify(key)
+        if entry is not None:
+            # 按代码规则得到的条目不会过期
+            entry["updated_at"] = None
+            with self._lock:
+                self._entries[key] = entry
+        return entry
+
+    def lot_size(self, symbol, stock_info=None) -> int:
+        """
+        每手股数，不发请求
+
+        :param stock_info: 已有的股票信息，代码未知时据此学习
+        """
+        entry = self.get(symbol)
+        if entry is None and stock_info:
+            entry = self.learn(symbol, stock_info)
+        return entry["lot"] if entry else DEFAULT_LOT
+
+    def learn(self, symbol, stock_info):
+        """从股票信息学习一个条目并持久化"""
+        entry = self.from_stock_info(symbol, stock_info)
+        if entry is None:
+            return None
+        entry["updated_at"] = time.time()
+        with self._lock:
+            self._entries[entry["symbol"]] = entry
+        if self.db_path:
+            self._save_to_db(entry)
+        return entry
+
+    def is_stale(self, symbol) -> bool:
+        """未知代码或从接口学到且已过期的条目"""
+        entry = self.get(symbol)
+        if entry is None:
+            return True
+        updated_at = entry.get("updated_at")
+        return updated_at is not None and time.time() - updated_at > self.refresh_ttl
+
+    def resolve(self, symbols, lookup):
+        """
+        补全未知或过期的条目
+
+        :param symbols: 股票代码列表
+        :param lookup: symbol -> 股票信息 的函数，通常为搜索接口
+        :return: 本次补全的代码数
+        """
+        resolved = 0
+        for symbol in symbols:
+            if symbol and self.is_stale(symbol):
+                if self.learn(symbol, lookup(symbol)) is not None:
+                    resolved += 1
+                else:
+                    logger.warning("无法获取证券信息: %s，按每手 %d 股处理", symbol, DEFAULT_LOT)
+        return resolved
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS instrument ("
+            "symbol TEXT PRIMARY KEY, type TEXT NOT NULL, lot INTEGER NOT NULL, "
+            "exchange TEXT, tick REAL, updated_at REAL NOT NULL)"
+        )
+        return conn
+
+    def _load_from_db(self):
+        try:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = self._connect()
+            try:
+                rows = conn.execute("SELECT symbol, type, lot, exchange, tick, updated_at FROM instrument").fetchall()
+            finally:
+                conn.close()
+        except (OSError, sqlite3.Error) as e:
+            logger.warning("加载证券信息索引失败: %s", e)
+            return
+        with self._lock:
+            for symbol, kind, lot, exchange, tick, updated_at in rows:
+                self._entries[symbol] = {"symbol": symbol, "type": kind, "lot": lot, "exchange": exchange,
+                                         "tick": tick, "updated_at": updated_at}
+        logger.debug("已加载 %d 条证券信息", len(rows))
+
+    def _save_to_db(self, entry):
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO instrument (symbol, type, lot, exchange, tick, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (entry["symbol"], entry["type"], entry["lot"], entry["exchange"], entry["tick"],
+                         entry["updated_at"]),
+                    )
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning("保存证券信息失败: %s", e)
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_default_instrument_index() -> InstrumentIndex:
+    """进程内共享的默认索引，只保存在内存中；需要持久化时传入 db_path 自行创建 InstrumentIndex"""
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = InstrumentIndex()
+        return _default_index
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+分页读取
+
+按页惰性读取雪球的列表接口（模拟仓交易记录、组合调仓历史等）：
+- 每次只在内存中保留当前页和预取的下一页，历史再长内存占用也不变
+- 消费当前页时在后台线程预取下一页
+- cursor 记录下一条记录的位置 (页码, 页内序号)，可用来从中断处继续读取
+- 提供 key 时，某页与上一页重复（接口忽略页码）即停止，避免无限读取
+- truncated 表示因上述重复或 max_pages 提前停止，没有读到最后一页
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.log import logger
+
+
+class PageIterator:
+    """
+    分页迭代器
+
+    :param fetch_page: fetch_page(page, page_size) -> 记录列表，页码从 1 开始
+    :param page_size: 每页记录数
+    :param cursor: 从 (页码, 页内序号) 继续读取，默认从第一条开始
+    :param prefetch: 是否在后台预取下一页
+    :param max_pages: 最多读取的页数，None 表示读到最后一页
+    :param key: key(记录) -> 记录 ID；某页第一条与上一页相同或没有新 ID 时停止读取
+    """
+
+    def __init__(self, fetch_page, page_size=50, cursor=None, prefetch=True, max_pages=None, key=None):
+        self.fetch_page = fetch_page
+        self.page_size = page_size
+        self.prefetch = prefetch
+        self.max_pages = max_pages
+        self._page, self._offset = cursor or (1, 0)
+        self._items = None
+        self._next = None
+        self._pages_read = 0
+        self._executor = None
+        self._done = False
+        # 因页面重复或达到 max_pages 而提前停止
+        self.truncated = False
+        self.key = key
+        # 上一页的第一条 ID 和全部 ID
+        self._last_first = None
+        self._last_ids = None
+
+    @property
+    def cursor(self):
+        """下一条记录的位置 (页码, 页内序号)"""
+        return self._page, self._offset
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while True:
+            if self._done:
+                raise StopIteration
+            if self._items is None:
+                self._items = self._load_page()
+                if self._items is None:
+                    self.close()
+                    raise StopIteration
+            if self._offset < len(self._items):
+                item = self._items[self._offset]
+                self._offset += 1
+                return item
+            if len(self._items) < self.page_size:
+                # 最后一页
+                self.close()
+                raise StopIteration
+            self._page += 1
+            self._offset = 0
+            self._items = None
+
+    def _load_page(self):
+        if self.max_pages is not None and self._pages_read >= self.max_pages:
+            self.truncated = True
+            return None
+        if self._next is not None and self._next[0] == self._page:
+            items = self._next[1].result()
+        else:
+            items = self._fetch(self._page)
+        self._next = None
+        self._pages_read += 1
+        if self._is_repeated(items):
+            logger.warning("第 %d 页与上一页重复，接口可能不支持分页，停止读取", self._page)
+            self.truncated = True
+            return None
+
+        more = len(items) >= self.page_size
+        if more and self.prefetch and (self.max_pages is None or self._pages_read < self.max_pages):
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1)
+            self._next = (self._page + 1, self._executor.submit(self._fetch, self._page + 1))
+        return items
+
+    def _is_repeated(self, items):
+        if self.key is None or not items:
+            return False
+        first = self.key(items[0])
+        ids = {self.key(item) for item in items}
+        repeated = self._last_ids is not None and (first == self._last_first or ids <= self._last_ids)
+        self._last_first, self._last_ids = first, ids
+        return repeated
+
+    def _fetch(self, page):
+        try:
+            return self.fetch_page(page, self.page_size) or []
+        except Exception as e:
+            logger.error("读取第 %d 页失败: %s", page, e)
+            raise
+
+    def close(self):
+        """停止读取并释放预取线程"""
+        self._done = True
+        self._next = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+行情与证券信息缓存
+
+交易端、模拟仓和 Web 后台共用的股票信息缓存：
+- 静态字段（名称、stock_id、flag、证券类型等）有效期长
+- 价格字段（current、percent、chg）有效期短
+- 按 LRU 淘汰，记录命中/未命中次数
+- 可选将静态字段持久化到 SQLite，重启后直接命中
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from utils.log import logger
+
+PRICE_FIELDS = ("current", "percent", "chg")
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "xueqiu_trader.db")
+
+
+class QuoteCache:
+    """
+    股票信息缓存
+
+    :param static_ttl: 静态字段有效期（秒）
+    :param price_ttl: 价格字段有效期（秒）
+    :param max_size: 最多缓存的股票数量
+    :param db_path: SQLite 数据库路径，提供时持久化静态字段
+    """
+
+    def __init__(self, static_ttl=24 * 3600, price_ttl=10, max_size=5000, db_path=None):
+        self.static_ttl = static_ttl
+        self.price_ttl = price_ttl
+        self.max_size = max_size
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+
+        # symbol -> [静态字段, 静态更新时间, 价格字段, 价格更新时间]
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if db_path:
+            self._load_from_db()
+
+    @staticmethod
+    def _key(symbol):
+        return str(symbol).upper()
+
+    def get(self, symbol):
+        """获取包含最新价格的完整信息，静态或价格字段过期时返回 None"""
+        return self._lookup(symbol, with_price=True)
+
+    def get_static(self, symbol):
+        """只获取静态字段（不含价格），过期时返回 None"""
+        return self._lookup(symbol, with_price=False)
+
+    def _lookup(self, symbol, with_price):
+        key = self._key(symbol)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                static, static_at, price, price_at = entry
+                fresh = now - static_at < self.static_ttl
+                if fresh and with_price:
+                    fresh = price is not None and now - price_at < self.price_ttl
+                if fresh:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    info = dict(static)
+                    if with_price:
+                        info.update(price)
+                    return info
+            self.misses += 1
+            return None
+
+    def put(self, symbol, info):
+        """写入股票信息，自动拆分静态字段和价格字段"""
+        if not info:
+            return
+        key = self._key(symbol)
+        now = time.time()
+        static = {k: v for k, v in info.items() if k not in PRICE_FIELDS}
+        price = {k: info[k] for k in PRICE_FIELDS if k in info}
+        with self._lock:
+            entry = self._entries.get(key)
+            static_changed = entry is None or entry[0] != static
+            self._entries[key] = [static, now, price or None, now]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        if self.db_path and static_changed:
+            self._save_to_db(key, static, now)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS instrument_cache ("
+            "symbol TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        return conn
+
+    def _load_from_db(self):
+        cutoff = time.time() - self.static_ttl
+        try:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = self._connect()
+            try:
+                rows = conn.execute(
+                    "SELECT symbol, data, updated_at FROM instrument_cache WHERE updated_at > ? "
+                    "ORDER BY updated_at DESC LIMIT ?",
+                    (cutoff, self.max_size),
+                ).fetchall()
+            finally:
+                conn.close()
+        except (OSError, sqlite3.Error) as e:
+            logger.warning("加载股票信息缓存失败: %s", e)
+            return
+        with self._lock:
+            for symbol, data, updated_at in reversed(rows):
+                self._entries[symbol] = [json.loads(data), updated_at, None, 0]
+        logger.debug("已加载 %d 条股票信息缓存", len(rows))
+
+    def _save_to_db(self, key, static, updated_at):
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO instrument_cache (symbol, data, updated_at) VALUES (?, ?, ?)",
+                        (key, json.dumps(static, ensure_ascii=False), updated_at),
+                    )
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning("保存股票信息缓存失败: %s", e)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_quote_cache() -> QuoteCache:
+    """进程内共享的默认缓存，静态字段持久化到 data/xueqiu_trader.db"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = QuoteCache(db_path=DEFAULT_DB_PATH)
+        return _default_cache
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+请求限流
+
+所有访问雪球的会话共用一组令牌桶：
+- 每类接口（调仓历史、组合持仓、股票搜索、下单等）有独立的速率预算
+- 另有一个全局桶限制总请求速率；轮询类请求不能动用全局桶中为下单预留的令牌
+- 默认将桶状态保存在 SQLite 中，同一台机器上的多个脚本进程共享同一份预算
+"""
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+
+from utils.log import logger
+
+PRIORITY_HIGH = 0
+PRIORITY_LOW = 1
+
+# 接口分类: (URL 片段, 接口名)，按顺序匹配
+ENDPOINT_RULES = (
+    ("/transaction/add.json", "order"),
+    ("/rebalancing/create.json", "order"),
+    ("/rebalancing/history.json", "history"),
+    ("/rebalancing/current.json", "current"),
+    ("/cubes/quote.json", "current"),
+    ("/batch/quote.json", "quote"),
+    ("search", "search"),
+)
+
+# 接口名: (每秒令牌数, 桶容量)
+DEFAULT_BUDGETS = {
+    "order": (2.0, 5),
+    "history": (2.0, 5),
+    "current": (2.0, 5),
+    "search": (3.0, 10),
+    "quote": (3.0, 10),
+    "default": (2.0, 5),
+}
+DEFAULT_GLOBAL_BUDGET = (5.0, 15)
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "rate_limit.db")
+
+
+class MemoryBucketStore:
+    """进程内令牌桶存储"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, wants, now):
+        """
+        原子地从多个桶中取令牌
+
+        :param wants: [(桶名, 速率, 容量, 需要令牌数, 需保留令牌数)]
+        :return: 0 表示成功，否则为建议等待的秒数
+        """
+        with self._lock:
+            state = {name: self._buckets.get(name, (capacity, now)) for name, _, capacity, _, _ in wants}
+            wait, refilled = _plan(wants, state, now)
+            if wait == 0:
+                self._buckets.update(refilled)
+            return wait
+
+
+class SQLiteBucketStore:
+    """基于 SQLite 的令牌桶存储，可在多个进程间共享"""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_bucket ("
+                "name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def take(self, wants, now):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            names = [w[0] for w in wants]
+            rows = conn.execute(
+                "SELECT name, tokens, updated FROM rate_bucket WHERE name IN (%s)" % ",".join("?" * len(names)),
+                names,
+            ).fetchall()
+            stored = {name: (tokens, updated) for name, tokens, updated in rows}
+            state = {name: stored.get(name, (capacity, now)) for name, _, capacity, _, _ in wants}
+            wait, refilled = _plan(wants, state, now)
+            if wait == 0:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO rate_bucket (name, tokens, updated) VALUES (?, ?, ?)",
+                    [(name, tokens, updated) for name, (tokens, updated) in refilled.items()],
+                )
+            conn.execute("COMMIT")
+            return wait
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def _plan(wants, state, now):
+    """按当前时间补充令牌并判断能否全部取到，返回 (等待秒数, 扣除后的桶状态)"""
+    wait = 0.0
+    refilled = {}
+    for name, rate, capacity, cost, reserve in wants:
+        tokens, updated = state[name]
+        tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+        if tokens - cost < reserve:
+            wait = max(wait, (reserve + cost - tokens) / rate)
+        refilled[name] = (tokens - cost, now)
+    return wait, refilled
+
+
+class RateLimiter:
+    """
+    按接口分类的请求限流器
+
+    :param budgets: {接口名: (每秒令牌数, 桶容量)}，未提供的接口使用默认预算
+    :param global_budget: 全局桶 (每秒令牌数, 桶容量)
+    :param priority_reserve: 全局桶中为下单请求保留的令牌数
+    :param store: 令牌桶存储，默认为进程内存储；传入 SQLiteBucketStore 可跨进程共享
+    :param enabled: 为 False 时不做任何限流
+    """
+
+    def __init__(self, budgets=None, global_budget=DEFAULT_GLOBAL_BUDGET, priority_reserve=3,
+                 store=None, enabled=True):
+        self.budgets = dict(DEFAULT_BUDGETS)
+        if budgets:
+            self.budgets.update(budgets)
+        self.global_budget = global_budget
+        self.priority_reserve = priority_reserve
+        self.store = store if store is not None else MemoryBucketStore()
+        self.enabled = enabled
+
+    @staticmethod
+    def classify(url) -> str:
+        for fragment, endpoint in ENDPOINT_RULES:
+            if fragment in url:
+                return endpoint
+        return "default"
+
+    def priority_of(self, endpoint) -> int:
+        return PRIORITY_HIGH if endpoint == "order" else PRIORITY_LOW
+
+    def acquire(self, url, timeout=None) -> bool:
+        """
+        阻塞直到取得该 URL 对应接口的令牌
+
+        :param timeout: 最长等待秒数，None 表示一直等待
+        :return: 是否取得令牌
+        """
+        if not self.enabled:
+            return True
+
+        endpoint = self.classify(url)
+        rate, capacity = self.budgets.get(endpoint, self.budgets["default"])
+        global_rate, global_capacity = self.global_budget
+        reserve = 0 if self.priority_of(endpoint) == PRIORITY_HIGH else self.priority_reserve
+        wants = [
+            ("endpoint:" + endpoint, rate, capacity, 1, 0),
+            ("global", global_rate, global_capacity, 1, reserve),
+        ]
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        waited = False
+        while True:
+            try:
+                wait = self.store.take(wants, time.time())
+            except sqlite3.Error as e:
+                # 共享存储不可用时不阻塞业务请求
+                logger.warning("限流存储不可用，跳过限流: %s", e)
+                return True
+            if wait == 0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            if not waited:
+                logger.debug("请求被限流 [%s]，等待 %.2f 秒", endpoint, wait)
+                waited = True
+            time.sleep(min(wait, 1.0))
+
+
+class RateLimitedSession(requests.Session):
+    """每次请求前先向限流器申请令牌的会话"""
+
+    def __init__(self, rate_limiter=None):
+        super().__init__()
+        self.rate_limiter = rate_limiter or get_default_limiter()
+
+    def request(self, method, url, *args, **kwargs):
+        self.rate_limiter.acquire(url)
+        return super().request(method, url, *args, **kwargs)
+
+
+_default_limiter = None
+_default_limiter_lock = threading.Lock()
+
+
+def get_default_limiter() -> RateLimiter:
+    """进程内共享的默认限流器，桶状态保存在 data/rate_limit.db 中跨进程共享"""
+    global _default_limiter
+    with _default_limiter_lock:
+        if _default_limiter is None:
+            try:
+                store = SQLiteBucketStore(DEFAULT_DB_PATH)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning("无法打开限流数据库，改用进程内限流: %s", e)
+                store = MemoryBucketStore()
+            _default_limiter = RateLimiter(store=store)
+        return _default_limiter
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+接口录制与回放
+
+- RecordingSession: 正常访问雪球，同时把每个 GET 请求的响应保存到目录
+- ReplaySession: 不访问网络，按 URL 和参数从目录中读取录制的响应；
+  下单接口（transaction/add.json 等）直接返回成功
+
+录制文件名由接口名和排序后的请求参数组成，如 performances__gid=123.json，
+可以直接编辑或手写，用于离线、可重复地运行 tests/ 下的同步脚本。
+"""
+import hashlib
+import json
+import os
+import re
+from urllib.parse import urlparse
+
+import requests
+
+from utils.log import logger
+from utils.rate_limit import RateLimitedSession
+
+MANIFEST_FILE = "manifest.json"
+
+# 回放时直接返回成功的写接口
+WRITE_ENDPOINTS = ("/transaction/add.json", "/rebalancing/create.json")
+
+
+def payload_name(url, params=None) -> str:
+    """录制文件名：接口名 + 排序后的参数，过长时用参数的哈希代替"""
+    path = urlparse(url).path
+    endpoint = os.path.splitext(os.path.basename(path))[0] or "index"
+    if not params:
+        return endpoint + ".json"
+    query = "&".join(f"{k}={v}" for k, v in sorted(dict(params).items()))
+    query = re.sub(r"[^\w=&.,-]", "_", query)
+    if len(query) > 100:
+        query = hashlib.md5(query.encode("utf-8")).hexdigest()[:16]
+    return f"{endpoint}__{query}.json"
+
+
+def make_response(url, payload, status_code=200) -> requests.Response:
+    resp = requests.Response()
+    resp.url = url
+    resp.status_code = status_code
+    resp.encoding = "utf-8"
+    resp._content = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    return resp
+
+
+def load_manifest(directory) -> dict:
+    """读取录制目录中的 manifest.json（模拟仓 ID、目标组合等运行参数）"""
+    with open(os.path.join(directory, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(directory, manifest):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+
+class RecordingSession(RateLimitedSession):
+    """
+    录制 GET 响应的会话
+
+    :param directory: 录制目录
+    :param rate_limiter: 同 RateLimitedSession
+    """
+
+    def __init__(self, directory, rate_limiter=None):
+        super().__init__(rate_limiter)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def request(self, method, url, *args, **kwargs):
+        resp = super().request(method, url, *args, **kwargs)
+        if method.upper() == "GET":
+            try:
+                payload = resp.json()
+            except ValueError:
+                return resp
+            path = os.path.join(self.directory, payload_name(url, kwargs.get("params")))
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False, indent=2)
+        return resp
+
+
+class ReplaySession(requests.Session):
+    """
+    从录制目录回放响应的会话，不发出任何网络请求
+
+    :param directory: 录制目录
+    """
+
+    def __init__(self, directory):
+        super().__init__()
+        self.directory = directory
+        # 回放过的写请求 [(url, data)]，便于检查
+        self.writes = []
+
+    def request(self, method, url, *args, **kwargs):
+        if any(endpoint in url for endpoint in WRITE_ENDPOINTS):
+            self.writes.append((url, kwargs.get("data")))
+            return make_response(url, {"success": True})
+
+        name = payload_name(url, kwargs.get("params"))
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            logger.warning("回放数据缺失: %s", name)
+            return make_response(url, {}, status_code=404)
+        with open(path, "r", encoding="utf-8") as f:
+            return make_response(url, json.load(f))
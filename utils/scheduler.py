@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+轮询调度
+
+跟踪端和模拟仓自动同步共用的轮询间隔策略：
+- FixedScheduler: 固定间隔（默认行为）
+- PollScheduler: 按 A 股交易日历和交易时段调整间隔，出错时指数退避，并加入随机抖动
+
+调度器本身不保存轮询状态，连续失败次数由调用方传入，同一个调度器可以被多个策略共用。
+"""
+import random
+from datetime import datetime, time as dtime, timedelta
+
+
+class TradingCalendar:
+    """
+    A 股交易日历
+
+    交易日为周一至周五且不在节假日列表中；节假日需要由配置提供
+    （如 user_config.json 中的 trading_holidays: ["2026-10-01", ...]）。
+    """
+
+    # (开始, 结束, 时段类型)
+    SESSIONS = (
+        (dtime(9, 15), dtime(9, 25), "auction"),
+        (dtime(9, 30), dtime(11, 30), "continuous"),
+        (dtime(13, 0), dtime(14, 57), "continuous"),
+        (dtime(14, 57), dtime(15, 0), "auction"),
+    )
+
+    def __init__(self, holidays=()):
+        self.holidays = set()
+        for day in holidays:
+            if isinstance(day, str):
+                day = datetime.strptime(day, "%Y-%m-%d").date()
+            self.holidays.add(day)
+
+    def is_trading_day(self, day) -> bool:
+        return day.weekday() < 5 and day not in self.holidays
+
+    def session_at(self, now: datetime):
+        """返回当前所处时段类型（"auction" / "continuous"），不在交易时段时返回 None"""
+        if not self.is_trading_day(now.date()):
+            return None
+        current = now.time()
+        for start, end, kind in self.SESSIONS:
+            if start <= current < end:
+                return kind
+        return None
+
+    def next_session_start(self, now: datetime) -> datetime:
+        """下一个交易时段的开始时间"""
+        day = now.date()
+        for _ in range(30):
+            if self.is_trading_day(day):
+                for start, _end, _kind in self.SESSIONS:
+                    start_at = datetime.combine(day, start)
+                    if start_at > now:
+                        return start_at
+            day += timedelta(days=1)
+        # 连续 30 天没有交易日只可能是日历配置错误，按一天后重新判断处理
+        return now + timedelta(days=1)
+
+    def is_trading_date_open(self, now: datetime) -> bool:
+        """当天是否为交易日且尚未收盘"""
+        return self.is_trading_day(now.date()) and now.time() < self.SESSIONS[-1][1]
+
+
+class FixedScheduler:
+    """
+    固定间隔调度
+
+    :param interval: 轮询间隔（秒）
+    :param error_delay: 出错后的重试间隔（秒）
+    """
+
+    def __init__(self, interval=10, error_delay=3):
+        self.interval = interval
+        self.error_delay = error_delay
+
+    def next_delay(self, errors=0, now=None) -> float:
+        return self.error_delay if errors else self.interval
+
+
+class PollScheduler:
+    """
+    按交易时段自适应的调度
+
+    :param session_interval: 连续竞价时段的轮询间隔（秒）
+    :param auction_interval: 开盘/收盘集合竞价时段的轮询间隔（秒）
+    :param idle_interval: 交易日非交易时段（午休、盘前）的轮询间隔（秒）
+    :param max_closed_sleep: 休市时单次最长等待时间（秒），到点后重新判断
+    :param max_backoff: 出错退避的最长等待时间（秒）
+    :param jitter: 随机抖动比例，0.1 表示 ±10%
+    :param calendar: 交易日历
+    """
+
+    def __init__(self, session_interval=10, auction_interval=3, idle_interval=120,
+                 max_closed_sleep=1800, max_backoff=300, jitter=0.1, calendar=None):
+        self.session_interval = session_interval
+        self.auction_interval = auction_interval
+        self.idle_interval = idle_interval
+        self.max_closed_sleep = max_closed_sleep
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.calendar = calendar or TradingCalendar()
+
+    def next_delay(self, errors=0, now=None) -> float:
+        """
+        计算下一次轮询前的等待时间
+
+        :param errors: 连续失败次数
+        :param now: 当前时间，默认取系统时间
+        """
+        if now is None:
+            now = datetime.now()
+
+        if errors:
+            delay = min(self.session_interval * 2 ** (errors - 1), self.max_backoff)
+            return self._apply_jitter(delay)
+
+        session = self.calendar.session_at(now)
+        if session == "auction":
+            delay = self.auction_interval
+        elif session == "continuous":
+            delay = self.session_interval
+        else:
+            until_open = (self.calendar.next_session_start(now) - now).total_seconds()
+            if self.calendar.is_trading_date_open(now):
+                # 盘前和午休：慢速轮询，但不错过下一时段开始
+                delay = min(self.idle_interval, until_open)
+            else:
+                # 收盘后和非交易日：休眠到下一交易时段
+                delay = min(until_open, self.max_closed_sleep)
+            # 只向后抖动，避免所有策略在开盘时刻同时发出请求，也不会早于开盘醒来
+            return max(delay, 1) + random.uniform(0, self.jitter * self.session_interval)
+        return self._apply_jitter(delay)
+
+    def _apply_jitter(self, delay):
+        if not self.jitter:
+            return delay
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
@@ -538,6 +538,57 @@ def get_simulator_info(gid):
         return jsonify({"success": False, "error": str(e)})
 
 
+@app.route("/api/history/simulator/<int:gid>", methods=["GET"])
+def get_simulator_history(gid):
+    """查询模拟仓交易记录（本地仓库），sync=1 时先从雪球增量同步"""
+    try:
+        sys.path.insert(0, BASE_DIR)
+        from xq_history_store import HistoryStore
+        
+        store = HistoryStore()
+        added = 0
+        if request.args.get("sync", type=int):
+            from xq_simulator import XueQiuSimulator
+            simulator = XueQiuSimulator()
+            simulator.login()
+            added = store.sync_sim_transactions(gid, simulator.iter_transactions(gid))
+        
+        transactions = store.transactions(
+            gid,
+            start=request.args.get("start"),
+            end=request.args.get("end"),
+            limit=request.args.get("limit", 100, type=int),
+        )
+        return jsonify({"success": True, "added": added, "transactions": transactions})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
+
+@app.route("/api/history/portfolio/<portfolio_code>", methods=["GET"])
+def get_portfolio_history(portfolio_code):
+    """查询组合调仓历史（本地仓库），sync=1 时先从雪球增量同步"""
+    try:
+        sys.path.insert(0, BASE_DIR)
+        from xq_history_store import HistoryStore
+        
+        store = HistoryStore()
+        added = 0
+        if request.args.get("sync", type=int):
+            from xq_simulator import XueQiuSimulator
+            simulator = XueQiuSimulator()
+            simulator.login()
+            added = store.sync_cube_rebalances(portfolio_code, simulator.iter_portfolio_rebalance_history(portfolio_code))
+        
+        rebalances = store.rebalances(
+            portfolio_code,
+            since=request.args.get("since", type=int),
+            until=request.args.get("until", type=int),
+            limit=request.args.get("limit", 100, type=int),
+        )
+        return jsonify({"success": True, "added": added, "rebalances": rebalances})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
 if __name__ == "__main__":
     add_log("info", "Web管理后台已启动")
     print("=" * 50)
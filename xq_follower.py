@@ -4,13 +4,15 @@
 
 通过轮询目标组合的调仓历史，将权重变化转换为交易指令。
 """
+import asyncio
+import functools
 import json
 import os
-import pickle
 import queue
 import re
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from numbers import Number
 
@@ -21,7 +23,8 @@ import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 from exceptions import TradeError, LoginError
-from utils import logger, parse_cookies_str
+from utils import (logger, parse_cookies_str, CmdJournal, ExpiredCmdIndex, FixedScheduler, RateLimitedSession,
+                   PageIterator)
 
 
 class XueQiuFollower:
@@ -43,18 +46,39 @@ class XueQiuFollower:
     PORTFOLIO_URL = "https://xueqiu.com/p/"
     WEB_REFERER = "https://www.xueqiu.com"
     CMD_CACHE_FILE = "cmd_cache.pk"
+    FOLLOW_STATE_FILE = "follow_state.json"
+    CATCHUP_PAGE_SIZE = 20
+    # asyncio 引擎错开各策略首次轮询的最长时间窗口（秒）
+    FIRST_POLL_SPREAD = 5.0
     
-    def __init__(self):
-        """初始化跟踪端"""
+    def __init__(self, rate_limiter=None):
+        """
+        初始化跟踪端
+        
+        :param rate_limiter: 请求限流器，默认使用进程间共享的 utils.get_default_limiter()
+        """
         self.trade_queue = queue.Queue()
-        self.expired_cmds = set()
+        self.expired_cmds = ExpiredCmdIndex()
+        self._cmd_journal = CmdJournal(self.CMD_CACHE_FILE)
         
-        self.session = requests.Session()
+        self.session = RateLimitedSession(rate_limiter)
         self.session.verify = False
         
         self.slippage = 0.0
         self._users = None
         self._adjust_sell = False
+        self._stop_event = threading.Event()
+        
+        # 每个策略最后处理过的调仓记录 {strategy: {"id": ..., "created_at": ...}}
+        self._last_rebalances = {}
+        # 已查询、等待指令下发完成后才记录的最新调仓 {strategy: rebalance}
+        self._pending_rebalances = {}
+        # 是否把跟踪状态写入 FOLLOW_STATE_FILE（与 cmd_cache 一致）
+        self._persist_state = True
+        self._state_lock = threading.Lock()
+        # 指令缓存的添加、日志追加和压缩需要作为一个整体执行
+        self._cmd_lock = threading.Lock()
+        self._expire_seconds = 120
     
     def _generate_headers(self) -> dict:
         """生成请求头"""
@@ -101,6 +125,10 @@ class XueQiuFollower:
         trade_cmd_expire_seconds=120,
         cmd_cache=True,
         slippage=0.0,
+        engine="thread",
+        max_concurrency=20,
+        cmd_cache_horizon=7 * 24 * 3600,
+        scheduler=None,
     ):
         """
         跟踪雪球组合
@@ -114,23 +142,37 @@ class XueQiuFollower:
         :param trade_cmd_expire_seconds: 交易指令过期时间（秒）
         :param cmd_cache: 是否使用指令缓存
         :param slippage: 滑点，0.0 表示无滑点
+        :param engine: 跟踪引擎，"thread" 每个策略一个线程，"asyncio" 单事件循环调度所有策略
+        :param max_concurrency: asyncio 引擎下同时进行的最大请求数
+        :param cmd_cache_horizon: 指令缓存保留期限（秒），更早的指令视为已执行并被淘汰
+        :param scheduler: 轮询调度器（如 utils.PollScheduler），默认按 track_interval 固定间隔轮询
         """
+        if engine not in ("thread", "asyncio"):
+            raise ValueError(f"不支持的跟踪引擎: {engine}")
+        
+        self._stop_event.clear()
         self.slippage = slippage
         self._adjust_sell = adjust_sell
+        self.expired_cmds.horizon = cmd_cache_horizon
+        self._expire_seconds = trade_cmd_expire_seconds
+        if scheduler is None:
+            scheduler = FixedScheduler(track_interval)
         self._users = self._wrap_list(users) if users else []
         
         strategies = self._wrap_list(strategies)
         total_assets = self._wrap_list(total_assets)
         initial_assets = self._wrap_list(initial_assets)
         
+        self._persist_state = cmd_cache
         if cmd_cache:
             self._load_expired_cmd_cache()
+            self._load_follow_state()
         
         # 启动交易执行线程
         if self._users:
             self._start_trader_thread(self._users, trade_cmd_expire_seconds)
         
-        # 为每个策略启动跟踪线程
+        tracked = []
         for strategy_url, strategy_total_assets, strategy_initial_assets in zip(
             strategies, total_assets, initial_assets
         ):
@@ -144,11 +186,22 @@ class XueQiuFollower:
             except Exception:
                 logger.error("抽取策略ID和名称失败，无效组合代码: %s", strategy_url)
                 raise
-            
+            tracked.append((strategy_id, strategy_name, assets))
+        
+        if engine == "asyncio":
+            try:
+                asyncio.run(self._follow_async(tracked, scheduler, max_concurrency))
+            except KeyboardInterrupt:
+                self.stop()
+                logger.info("跟踪程序已停止")
+            return
+        
+        # 为每个策略启动跟踪线程
+        for strategy_id, strategy_name, assets in tracked:
             strategy_worker = threading.Thread(
                 target=self._track_strategy_worker,
                 args=[strategy_id, strategy_name],
-                kwargs={"interval": track_interval, "assets": assets},
+                kwargs={"scheduler": scheduler, "assets": assets},
             )
             strategy_worker.daemon = True
             strategy_worker.start()
@@ -156,11 +209,17 @@ class XueQiuFollower:
         
         # 保持主线程运行
         try:
-            while True:
-                time.sleep(1)
+            while not self._stop_event.wait(1):
+                pass
         except KeyboardInterrupt:
+            self.stop()
             logger.info("跟踪程序已停止")
     
+    def stop(self):
+        """停止所有跟踪任务"""
+        self._stop_event.set()
+        self._cmd_journal.flush()
+    
     def _calculate_assets(self, strategy_url, total_assets=None, initial_assets=None):
         """计算总资产"""
         if total_assets is None and initial_assets is not None:
@@ -217,10 +276,11 @@ class XueQiuFollower:
         portfolio_info = self._get_portfolio_info(portfolio_code)
         return portfolio_info.get("net_value", 1.0)
     
-    def _track_strategy_worker(self, strategy, name, interval=10, **kwargs):
+    def _track_strategy_worker(self, strategy, name, scheduler, **kwargs):
         """策略跟踪工作线程"""
         poll_count = 0
-        while True:
+        errors = 0
+        while not self._stop_event.is_set():
             poll_count += 1
             logger.info("[%s] 轮询检查策略 %s... (第 %d 次)", 
                        datetime.now().strftime("%H:%M:%S"), name, poll_count)
@@ -229,62 +289,223 @@ class XueQiuFollower:
                 transactions = self._query_strategy_transaction(strategy, **kwargs)
             except Exception as e:
                 logger.exception("无法获取策略 %s 调仓信息, 错误: %s", name, e)
-                time.sleep(3)
+                errors += 1
+                self._stop_event.wait(scheduler.next_delay(errors))
                 continue
             
-            if not transactions:
-                logger.info("  未检测到新的调仓指令")
-            
-            for transaction in transactions:
-                trade_cmd = {
-                    "strategy": strategy,
-                    "strategy_name": name,
-                    "action": transaction["action"],
-                    "stock_code": transaction["stock_code"],
-                    "amount": transaction["amount"],
-                    "price": transaction["price"],
-                    "datetime": transaction["datetime"],
-                }
-                
-                if self._is_cmd_expired(trade_cmd):
-                    continue
-                
-                logger.info(
-                    "策略 [%s] 发送指令: 股票 %s %s %s股 价格 %.2f 时间 %s",
-                    name,
-                    trade_cmd["stock_code"],
-                    "买入" if trade_cmd["action"] == "buy" else "卖出",
-                    trade_cmd["amount"],
-                    trade_cmd["price"],
-                    trade_cmd["datetime"],
-                )
-                
-                self.trade_queue.put(trade_cmd)
-                self._add_cmd_to_expired(trade_cmd)
+            errors = 0
+            self._dispatch_transactions(strategy, name, transactions)
             
-            logger.info("  等待 %d 秒后再次检查...", interval)
+            delay = scheduler.next_delay()
+            logger.info("  等待 %.0f 秒后再次检查...", delay)
             try:
-                time.sleep(interval)
+                self._stop_event.wait(delay)
             except KeyboardInterrupt:
                 logger.info("程序退出")
                 break
     
+    async def _follow_async(self, tracked, scheduler, max_concurrency):
+        """
+        单事件循环跟踪所有策略
+        
+        阻塞的 HTTP 请求交给大小为 max_concurrency 的线程池执行，
+        由信号量限制同时在途的请求数，策略数量不再决定线程数量。
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        # 连接池与并发上限一致，避免并发请求时反复新建连接
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max_concurrency, pool_maxsize=max_concurrency)
+        previous_adapters = {prefix: self.session.adapters.get(prefix) for prefix in ("https://", "http://")}
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="xq-follow")
+        try:
+            tasks = []
+            # 错开各策略的首次轮询时间，避免所有请求同时发出；窗口不超过 FIRST_POLL_SPREAD，
+            # 非交易时段调度器给出的长间隔不会推迟首次检查
+            spread = min(scheduler.next_delay(), self.FIRST_POLL_SPREAD)
+            for index, (strategy_id, strategy_name, assets) in enumerate(tracked):
+                offset = spread * index / len(tracked)
+                tasks.append(asyncio.ensure_future(self._track_strategy_async(
+                    strategy_id, strategy_name, semaphore, executor,
+                    scheduler=scheduler, offset=offset, assets=assets,
+                )))
+                logger.info("开始跟踪策略: %s", strategy_name)
+            
+            while not self._stop_event.is_set():
+                await asyncio.sleep(0.2)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            executor.shutdown(wait=False)
+            # 恢复会话原来的连接池
+            for prefix, previous in previous_adapters.items():
+                if previous is not None:
+                    self.session.mount(prefix, previous)
+            adapter.close()
+    
+    async def _track_strategy_async(self, strategy, name, semaphore, executor,
+                                    scheduler, offset=0.0, **kwargs):
+        """策略跟踪协程，按调度器给出的节拍轮询，不随请求耗时漂移"""
+        loop = asyncio.get_running_loop()
+        next_run = loop.time() + offset
+        poll_count = 0
+        errors = 0
+        query = functools.partial(self._query_strategy_transaction, strategy, **kwargs)
+        while not self._stop_event.is_set():
+            await asyncio.sleep(max(0.0, next_run - loop.time()))
+            poll_count += 1
+            logger.info("[%s] 轮询检查策略 %s... (第 %d 次)",
+                       datetime.now().strftime("%H:%M:%S"), name, poll_count)
+            
+            try:
+                async with semaphore:
+                    transactions = await loop.run_in_executor(executor, query)
+            except Exception as e:
+                logger.exception("无法获取策略 %s 调仓信息, 错误: %s", name, e)
+                errors += 1
+                next_run = loop.time() + scheduler.next_delay(errors)
+                continue
+            
+            errors = 0
+            # 指令缓存的 fsync 和压缩在线程池中执行，不阻塞事件循环
+            await loop.run_in_executor(executor, self._dispatch_transactions, strategy, name, transactions)
+            
+            next_run += scheduler.next_delay()
+            # 落后超过一个周期时直接对齐到当前时间，避免连续补发
+            if next_run < loop.time():
+                next_run = loop.time()
+    
+    def _dispatch_transactions(self, strategy, name, transactions):
+        """将调仓记录转换为交易指令并放入交易队列"""
+        if not transactions:
+            logger.info("  未检测到新的调仓指令")
+        
+        for transaction in transactions:
+            trade_cmd = {
+                "strategy": strategy,
+                "strategy_name": name,
+                "action": transaction["action"],
+                "stock_code": transaction["stock_code"],
+                "amount": transaction["amount"],
+                "price": transaction["price"],
+                "datetime": transaction["datetime"],
+            }
+            
+            if self._is_cmd_expired(trade_cmd):
+                continue
+            
+            logger.info(
+                "策略 [%s] 发送指令: 股票 %s %s %s股 价格 %.2f 时间 %s",
+                name,
+                trade_cmd["stock_code"],
+                "买入" if trade_cmd["action"] == "buy" else "卖出",
+                trade_cmd["amount"],
+                trade_cmd["price"],
+                trade_cmd["datetime"],
+            )
+            
+            self.trade_queue.put(trade_cmd)
+            self._add_cmd_to_expired(trade_cmd)
+        
+        # 指令全部入队并写入缓存后才推进跟踪状态，中途出错或进程退出时下次轮询会重新处理这些调仓
+        with self._state_lock:
+            pending = self._pending_rebalances.pop(strategy, None)
+        if pending is not None:
+            self._remember_rebalance(strategy, pending)
+    
     def _query_strategy_transaction(self, strategy, **kwargs):
-        """查询策略调仓记录"""
+        """
+        查询策略调仓记录
+        
+        已记录上次处理的调仓时，从最新一条开始向前翻页补齐期间错过的调仓，
+        按时间先后返回；没有新调仓时只需一次 count=1 的请求。
+        """
+        last = self._last_rebalances.get(strategy)
+        expire_before = (time.time() - self._expire_seconds) * 1000
+        
+        missed = []
+        for rebalance in self._iter_rebalances(strategy):
+            if last is not None and (
+                rebalance.get("id") == last["id"]
+                or rebalance.get("created_at", 0) <= last["created_at"]
+            ):
+                break
+            if missed and rebalance.get("created_at", 0) < expire_before:
+                # 更早的调仓即使补发也会因超时被丢弃，不再翻页
+                break
+            missed.append(rebalance)
+            if last is None:
+                # 首次跟踪只处理最新一条调仓
+                break
+        
+        if not missed:
+            return []
+        
+        transactions = []
+        for rebalance in reversed(missed):
+            rebalance_transactions = self._extract_rebalance_transactions(rebalance)
+            self._project_transactions(rebalance_transactions, **kwargs)
+            transactions.extend(self._order_transactions_sell_first(rebalance_transactions))
+        # 由 _dispatch_transactions 在指令下发后记录
+        with self._state_lock:
+            self._pending_rebalances[strategy] = missed[0]
+        return transactions
+    
+    def _iter_rebalances(self, strategy):
+        """从新到旧逐条产出调仓记录，按需翻页"""
         params = {"cube_symbol": strategy, "page": 1, "count": 1}
         resp = self.session.get(self.TRANSACTION_API, params=params)
         history = resp.json()
+        if history.get("count", 0) <= 0 or not history.get("list"):
+            return
+        first = history["list"][0]
+        yield first
         
-        transactions = self._extract_transactions(history)
-        self._project_transactions(transactions, **kwargs)
-        return self._order_transactions_sell_first(transactions)
+        page = 1
+        while True:
+            params = {"cube_symbol": strategy, "page": page, "count": self.CATCHUP_PAGE_SIZE}
+            resp = self.session.get(self.TRANSACTION_API, params=params)
+            items = resp.json().get("list", [])
+            for rebalance in items:
+                if rebalance.get("id") == first.get("id"):
+                    continue
+                yield rebalance
+            if len(items) < self.CATCHUP_PAGE_SIZE:
+                return
+            page += 1
     
-    def _extract_transactions(self, history):
-        """提取调仓记录"""
-        if history.get("count", 0) <= 0:
-            return []
-        
-        raw_transactions = history["list"][0].get("rebalancing_histories", [])
+    def _remember_rebalance(self, strategy, rebalance):
+        """记录策略最新处理的调仓，启用指令缓存时持久化到状态文件"""
+        with self._state_lock:
+            self._last_rebalances[strategy] = {
+                "id": rebalance.get("id"),
+                "created_at": rebalance.get("created_at", 0),
+            }
+            if not self._persist_state:
+                return
+            tmp_path = self.FOLLOW_STATE_FILE + ".tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self._last_rebalances, f)
+                os.replace(tmp_path, self.FOLLOW_STATE_FILE)
+            except Exception as e:
+                logger.warning("保存跟踪状态失败: %s", e)
+    
+    def _load_follow_state(self):
+        """加载各策略最后处理的调仓记录"""
+        if not os.path.exists(self.FOLLOW_STATE_FILE):
+            return
+        try:
+            with open(self.FOLLOW_STATE_FILE, "r", encoding="utf-8") as f:
+                self._last_rebalances = json.load(f)
+            logger.info("已加载 %d 个策略的跟踪状态", len(self._last_rebalances))
+        except Exception as e:
+            logger.warning("加载跟踪状态失败: %s", e)
+    
+    def _extract_rebalance_transactions(self, rebalance):
+        """提取单次调仓中的个股调仓明细"""
+        raw_transactions = rebalance.get("rebalancing_histories", [])
         transactions = []
         
         for transaction in raw_transactions:
@@ -363,14 +584,12 @@ class XueQiuFollower:
         return sell_first
     
     def _load_expired_cmd_cache(self):
-        """加载已执行指令缓存"""
-        if os.path.exists(self.CMD_CACHE_FILE):
-            try:
-                with open(self.CMD_CACHE_FILE, "rb") as f:
-                    self.expired_cmds = pickle.load(f)
-                logger.info("已加载 %d 条历史指令缓存", len(self.expired_cmds))
-            except Exception as e:
-                logger.warning("加载指令缓存失败: %s", e)
+        """加载已执行指令缓存（快照 + 追加日志）"""
+        try:
+            self.expired_cmds.load_records(self._cmd_journal.load())
+            logger.info("已加载 %d 条历史指令缓存", len(self.expired_cmds))
+        except Exception as e:
+            logger.warning("加载指令缓存失败: %s", e)
     
     @staticmethod
     def _generate_cmd_key(cmd):
@@ -378,20 +597,25 @@ class XueQiuFollower:
         return f"{cmd['strategy_name']}_{cmd['stock_code']}_{cmd['action']}_{cmd['amount']}_{cmd['price']}_{cmd['datetime']}"
     
     def _is_cmd_expired(self, cmd):
-        """检查指令是否已执行"""
+        """检查指令是否已执行，超出缓存保留期限的指令同样视为已执行"""
+        if self.expired_cmds.is_stale(cmd["datetime"].timestamp()):
+            return True
         key = self._generate_cmd_key(cmd)
         return key in self.expired_cmds
     
     def _add_cmd_to_expired(self, cmd):
-        """添加指令到已执行缓存"""
+        """添加指令到已执行缓存，只向日志追加一条记录"""
         key = self._generate_cmd_key(cmd)
-        self.expired_cmds.add(key)
-        
-        try:
-            with open(self.CMD_CACHE_FILE, "wb") as f:
-                pickle.dump(self.expired_cmds, f)
-        except Exception as e:
-            logger.warning("保存指令缓存失败: %s", e)
+        timestamp = cmd["datetime"].timestamp()
+        # 多个线程同时下发指令时，压缩使用的快照必须包含所有已追加的记录，否则压缩会丢掉其他线程刚写入的指令
+        with self._cmd_lock:
+            digest = self.expired_cmds.add(key, timestamp)
+            try:
+                self._cmd_journal.append([digest, timestamp])
+                if self._cmd_journal.should_compact:
+                    self._cmd_journal.compact(self.expired_cmds.records())
+            except Exception as e:
+                logger.warning("保存指令缓存失败: %s", e)
     
     def _start_trader_thread(self, users, expire_seconds):
         """启动交易执行线程"""
@@ -457,3 +681,21 @@ class XueQiuFollower:
         params = {"cube_symbol": strategy, "page": 1, "count": count}
         resp = self.session.get(self.TRANSACTION_API, params=params)
         return resp.json().get("list", [])
+    
+    def iter_transactions(self, strategy: str, page_size: int = 20, cursor: tuple = None,
+                          prefetch: bool = True) -> PageIterator:
+        """
+        按页惰性读取策略全部调仓记录（从新到旧），内存中只保留当前页和预取的下一页
+        
+        :param strategy: 组合代码
+        :param page_size: 每页记录数
+        :param cursor: 从上次迭代器的 cursor 处继续读取
+        :param prefetch: 是否在后台预取下一页
+        :return: PageIterator
+        """
+        def fetch_page(page, size):
+            params = {"cube_symbol": strategy, "page": page, "count": size}
+            return self.session.get(self.TRANSACTION_API, params=params).json().get("list", [])
+        
+        return PageIterator(fetch_page, page_size=page_size, cursor=cursor, prefetch=prefetch,
+                            key=lambda record: record.get("id"))
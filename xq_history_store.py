@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+交易与调仓历史本地仓库 - HistoryStore
+
+把模拟仓交易记录和组合调仓历史保存到 data/xueqiu_trader.db（与 Web 后台同一个数据库）：
+- 每个模拟仓/组合记录一个高水位（最新一条已保存记录的 ID 和时间），同步时从新到旧翻页，
+  遇到高水位即停止，只下载新增记录；翻页提前中断（未读到高水位）时不推进高水位
+- 新记录在一个事务中批量写入
+- 报表和 Web 后台直接查询本地表，不再请求雪球
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from utils import logger
+from utils.quote_cache import DEFAULT_DB_PATH
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS sim_transaction ("
+    "gid INTEGER NOT NULL, tx_id TEXT NOT NULL, date TEXT, symbol TEXT, name TEXT, "
+    "type INTEGER, shares REAL, price REAL, data TEXT NOT NULL, "
+    "PRIMARY KEY (gid, tx_id))",
+    "CREATE INDEX IF NOT EXISTS ix_sim_transaction_gid_date ON sim_transaction (gid, date)",
+    "CREATE TABLE IF NOT EXISTS cube_rebalance ("
+    "cube TEXT NOT NULL, rb_id INTEGER NOT NULL, created_at INTEGER, status TEXT, data TEXT NOT NULL, "
+    "PRIMARY KEY (cube, rb_id))",
+    "CREATE INDEX IF NOT EXISTS ix_cube_rebalance_cube_created ON cube_rebalance (cube, created_at)",
+    "CREATE TABLE IF NOT EXISTS history_watermark ("
+    "kind TEXT NOT NULL, key TEXT NOT NULL, last_id TEXT, last_time TEXT, updated_at REAL NOT NULL, "
+    "PRIMARY KEY (kind, key))",
+)
+
+
+def _to_date(value):
+    """交易时间统一为 "YYYY-MM-DD HH:MM:SS" 字符串，毫秒时间戳会被转换"""
+    if isinstance(value, (int, float)) and value > 0:
+        return datetime.fromtimestamp(value / 1000).strftime("%Y-%m-%d %H:%M:%S")
+    return str(value) if value else None
+
+
+class HistoryStore:
+    """
+    交易与调仓历史仓库
+
+    :param db_path: SQLite 数据库路径
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        conn = self._connect()
+        try:
+            with conn:
+                for statement in SCHEMA:
+                    conn.execute(statement)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def watermark(self, kind, key):
+        """
+        获取高水位
+
+        :param kind: "sim_transaction" 或 "cube_rebalance"
+        :return: (last_id, last_time)，没有记录时为 (None, None)
+        """
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT last_id, last_time FROM history_watermark WHERE kind = ? AND key = ?",
+                               (kind, str(key))).fetchone()
+        finally:
+            conn.close()
+        return (row["last_id"], row["last_time"]) if row else (None, None)
+
+    def _collect_new(self, kind, key, records, id_of, time_of):
+        """
+        从新到旧读取记录，遇到高水位即停止
+
+        :return: (新记录列表, 是否完整)；未遇到高水位且分页被提前中断（PageIterator.truncated）时不完整，
+                 高水位与已读记录之间可能还有未下载的记录
+        """
+        last_id, last_time = self.watermark(kind, key)
+        new = []
+        reached = False
+        try:
+            for record in records:
+                record_id = str(id_of(record))
+                record_time = time_of(record)
+                if record_id == last_id:
+                    reached = True
+                    break
+                if last_time is not None and record_time is not None and str(record_time) < last_time:
+                    reached = True
+                    break
+                new.append(record)
+        finally:
+            close = getattr(records, "close", None)
+            if close is not None:
+                close()
+        complete = reached or not getattr(records, "truncated", False)
+        if not complete:
+            logger.warning("%s %s 分页提前中断，已保存读到的记录，高水位保持不变", kind, key)
+        return new, complete
+
+    def _save(self, kind, key, insert_sql, rows, newest_id, newest_time, advance=True):
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany(insert_sql, rows)
+                    if advance:
+                        conn.execute(
+                            "INSERT OR REPLACE INTO history_watermark (kind, key, last_id, last_time, updated_at) "
+                            "VALUES (?, ?, ?, ?, ?)",
+                            (kind, str(key), newest_id, newest_time, time.time()),
+                        )
+            finally:
+                conn.close()
+
+    def sync_sim_transactions(self, gid, records) -> int:
+        """
+        增量保存模拟仓交易记录
+
+        :param gid: 模拟仓 ID
+        :param records: 从新到旧的交易记录，如 XueQiuSimulator.iter_transactions(gid)
+        :return: 新增记录数
+        """
+        new, complete = self._collect_new("sim_transaction", gid, records,
+                                          lambda t: t.get("id"), lambda t: _to_date(t.get("date") or t.get("created_at")))
+        if not new:
+            return 0
+        rows = [(
+            gid, str(t.get("id")), _to_date(t.get("date") or t.get("created_at")), t.get("symbol"), t.get("name"),
+            t.get("type"), t.get("shares"), t.get("price"), json.dumps(t, ensure_ascii=False),
+        ) for t in new]
+        self._save("sim_transaction", gid,
+                   "INSERT OR REPLACE INTO sim_transaction (gid, tx_id, date, symbol, name, type, shares, price, data) "
+                   "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                   rows, rows[0][1], rows[0][2], advance=complete)
+        logger.info("模拟仓 %s 新增 %d 条交易记录", gid, len(rows))
+        return len(rows)
+
+    def sync_cube_rebalances(self, cube, records) -> int:
+        """
+        增量保存组合调仓历史
+
+        :param cube: 组合代码
+        :param records: 从新到旧的调仓记录，如 XueQiuSimulator.iter_portfolio_rebalance_history(cube)
+        :return: 新增记录数
+        """
+        # created_at 为毫秒时间戳，补零到固定长度后按字符串比较与数值顺序一致
+        new, complete = self._collect_new("cube_rebalance", cube, records,
+                                          lambda r: r.get("id"), lambda r: "%015d" % int(r.get("created_at") or 0))
+        if not new:
+            return 0
+        rows = [(
+            cube, r.get("id"), r.get("created_at"), r.get("status"), json.dumps(r, ensure_ascii=False),
+        ) for r in new]
+        self._save("cube_rebalance", cube,
+                   "INSERT OR REPLACE INTO cube_rebalance (cube, rb_id, created_at, status, data) VALUES (?, ?, ?, ?, ?)",
+                   rows, str(rows[0][1]), "%015d" % int(rows[0][2] or 0), advance=complete)
+        logger.info("组合 %s 新增 %d 条调仓记录", cube, len(rows))
+        return len(rows)
+
+    def transactions(self, gid, start=None, end=None, limit=100) -> list:
+        """
+        查询本地交易记录（新的在前）
+
+        :param start: 起始日期（含），如 "2026-01-01"
+        :param end: 结束日期（不含）
+        """
+        sql = "SELECT data FROM sim_transaction WHERE gid = ?"
+        params = [gid]
+        if start:
+            sql += " AND date >= ?"
+            params.append(start)
+        if end:
+            sql += " AND date < ?"
+            params.append(end)
+        sql += " ORDER BY date DESC LIMIT ?"
+        params.append(limit)
+        conn = self._connect()
+        try:
+            return [json.loads(row["data"]) for row in conn.execute(sql, params)]
+        finally:
+            conn.close()
+
+    def rebalances(self, cube, since=None, until=None, limit=100) -> list:
+        """
+        查询本地调仓历史（新的在前）
+
+        :param since: 起始时间（毫秒时间戳，含）
+        :param until: 结束时间（毫秒时间戳，不含）
+        """
+        sql = "SELECT data FROM cube_rebalance WHERE cube = ?"
+        params = [cube]
+        if since:
+            sql += " AND created_at >= ?"
+            params.append(since)
+        if until:
+            sql += " AND created_at < ?"
+            params.append(until)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        conn = self._connect()
+        try:
+            return [json.loads(row["data"]) for row in conn.execute(sql, params)]
+        finally:
+            conn.close()
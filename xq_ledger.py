@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+模拟仓影子账本 - ShadowLedger
+
+在本地按成交结果维护每个模拟仓的持仓股数和现金：
+- 下单成功后立即按成交价、税费更新本地账本，不再重新查询服务器
+- 每隔 reconcile_interval 秒，或成交结果不确定（下单异常）时，才重新请求 performances.json 对账
+- 对账时发现本地与服务器不一致会记录日志，并以服务器数据为准
+"""
+import threading
+import time
+from datetime import datetime
+
+from utils import logger
+
+
+class ShadowLedger:
+    """
+    模拟仓影子账本
+
+    :param reconcile_interval: 两次对账之间的最长间隔（秒）
+    :param cash_tolerance: 对账时允许的现金误差（元），超过视为不一致
+    :param max_fills: 每个模拟仓保留的最近成交记录数
+    """
+
+    def __init__(self, reconcile_interval=300, cash_tolerance=1.0, max_fills=50):
+        self.reconcile_interval = reconcile_interval
+        self.cash_tolerance = cash_tolerance
+        self.max_fills = max_fills
+        # gid -> {"performance", "holdings": {symbol: holding}, "reconciled_at", "drift", "fills"}
+        self._accounts = {}
+        self._lock = threading.Lock()
+
+    def snapshot(self, gid, now=None):
+        """
+        本地账户快照，格式同 XueQiuSimulator.get_account_snapshot
+
+        :return: 快照；没有账本、需要对账或账本已标记不一致时返回 None
+        """
+        if now is None:
+            now = time.time()
+        with self._lock:
+            account = self._accounts.get(gid)
+            if account is None or account["drift"] or now - account["reconciled_at"] >= self.reconcile_interval:
+                return None
+            return {
+                "performance": dict(account["performance"]),
+                "holdings": [dict(h) for h in account["holdings"].values()],
+                "fetched_at": account["reconciled_at"],
+            }
+
+    def reconcile(self, gid, snapshot):
+        """
+        用服务器返回的账户快照重置账本，并检查本地账本是否偏离
+
+        :param snapshot: get_account_snapshot 从服务器获取的快照
+        :return: 是否发现不一致
+        """
+        performance = snapshot.get("performance") or {}
+        if not performance:
+            # 请求失败时不覆盖账本，下次继续对账
+            return False
+        holdings = {h["symbol"]: dict(h) for h in snapshot.get("holdings", []) if h.get("symbol")}
+        with self._lock:
+            account = self._accounts.get(gid)
+            drifted = account is not None and self._diff(gid, account, performance, holdings)
+            self._accounts[gid] = {
+                "performance": dict(performance),
+                "holdings": holdings,
+                "reconciled_at": snapshot.get("fetched_at", time.time()),
+                "drift": False,
+                "fills": account["fills"] if account else [],
+            }
+        return drifted
+
+    def _diff(self, gid, account, performance, holdings):
+        drifted = False
+        for symbol in set(account["holdings"]) | set(holdings):
+            local = int(float(account["holdings"].get(symbol, {}).get("shares", 0)))
+            remote = int(float(holdings.get(symbol, {}).get("shares", 0)))
+            if local != remote:
+                logger.warning("影子账本与服务器不一致 [%s] %s: 本地 %d 股, 服务器 %d 股", gid, symbol, local, remote)
+                drifted = True
+        local_cash = float(account["performance"].get("cash", 0))
+        remote_cash = float(performance.get("cash", 0))
+        if abs(local_cash - remote_cash) > self.cash_tolerance:
+            logger.warning("影子账本与服务器不一致 [%s] 现金: 本地 %.2f, 服务器 %.2f", gid, local_cash, remote_cash)
+            drifted = True
+        return drifted
+
+    def apply_fill(self, gid, symbol, price, shares, trade_type, tax_rate=0.0, commission_rate=0.0, name=None):
+        """
+        按一笔成功的成交更新账本，没有该模拟仓的账本时忽略
+
+        :param trade_type: 1=买入, 2=卖出
+        :param tax_rate: 税率（千分位），只对卖出收取
+        :param commission_rate: 佣金率（千分位）
+        """
+        value = price * shares
+        with self._lock:
+            account = self._accounts.get(gid)
+            if account is None:
+                return
+            performance = account["performance"]
+            holding = account["holdings"].get(symbol)
+            if holding is None:
+                holding = account["holdings"][symbol] = {"symbol": symbol, "name": name, "shares": 0, "current": price}
+            held = float(holding.get("shares", 0))
+            if trade_type == 1:
+                fee = value * commission_rate / 1000.0
+                held += shares
+                performance["cash"] = float(performance.get("cash", 0)) - value - fee
+            else:
+                fee = value * (commission_rate + tax_rate) / 1000.0
+                held -= shares
+                performance["cash"] = float(performance.get("cash", 0)) + value - fee
+            performance["assets"] = float(performance.get("assets", 0)) - fee
+            if held > 0:
+                holding["shares"] = held
+                holding["current"] = price
+                holding["market_value"] = held * price
+            else:
+                account["holdings"].pop(symbol, None)
+
+            account["fills"].insert(0, {
+                "type": trade_type,
+                "symbol": symbol,
+                "name": name or holding.get("name"),
+                "shares": shares,
+                "price": price,
+                "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            })
+            del account["fills"][self.max_fills:]
+
+    def mark_drift(self, gid):
+        """成交结果不确定时调用，下次取快照时强制对账"""
+        with self._lock:
+            account = self._accounts.get(gid)
+            if account is not None:
+                account["drift"] = True
+
+    def is_drifted(self, gid) -> bool:
+        with self._lock:
+            account = self._accounts.get(gid)
+            return account is not None and account["drift"]
+
+    def recent_fills(self, gid) -> list:
+        """本地记录的最近成交（新的在前）"""
+        with self._lock:
+            account = self._accounts.get(gid)
+            return list(account["fills"]) if account else []
+
+    def forget(self, gid):
+        with self._lock:
+            self._accounts.pop(gid, None)
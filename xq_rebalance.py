@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+模拟仓调仓计划 - RebalancePlan
+
+根据模拟仓资产、持仓、目标组合权重和行情计算目标股数，
+得到先卖后买的交易清单。计划只做计算不发请求，可以先检查、记录，再交给
+XueQiuSimulator.sync_from_portfolio 执行。
+"""
+import heapq
+import time
+from datetime import datetime
+
+from utils import logger, get_default_instrument_index
+
+
+def lot_size_of(symbol: str, stock_info: dict = None, instruments=None) -> int:
+    """
+    每手股数（可转债 10 张，股票 100 股），从证券信息索引读取，不发请求
+
+    :param stock_info: 已有的股票信息，代码不在索引中时据此判断
+    :param instruments: InstrumentIndex，默认使用共享索引
+    """
+    return (instruments or get_default_instrument_index()).lot_size(symbol, stock_info)
+
+
+class RebalancePlan:
+    """
+    一次调仓计划
+
+    :param gid: 模拟仓 ID
+    :param portfolio_code: 目标组合代码
+    :param total_assets: 模拟仓总资产
+    :param cash: 模拟仓现金
+    :param target_cash_weight: 目标组合现金比例（%）
+    """
+
+    def __init__(self, gid, portfolio_code, total_assets=0, cash=0, target_cash_weight=0):
+        self.gid = gid
+        self.portfolio_code = portfolio_code
+        self.total_assets = total_assets
+        self.cash = cash
+        self.target_cash_weight = target_cash_weight
+        self.created_at = datetime.now()
+
+        # symbol -> {"shares", "current", "name"}
+        self.holdings = {}
+        # symbol -> {"target_shares", "target_value", "current_price", "name", "weight"}
+        self.targets = {}
+        self.sells = []
+        self.buys = []
+        self.skipped = []
+        self.errors = []
+        # 计划无法生成时的原因（如目标组合无持仓）
+        self.error = None
+        # optimize 估算的调仓后现金（已扣除税费）
+        self.cash_after = None
+
+    @property
+    def need_sync(self) -> bool:
+        return self.error is None and bool(self.buys or self.sells)
+
+    @classmethod
+    def build(cls, gid, portfolio_code, performance, holdings, target_holdings,
+              target_cash_weight, quotes, instruments=None):
+        """
+        计算调仓计划
+
+        :param performance: 模拟仓收益信息（get_performances 的返回值）
+        :param holdings: 模拟仓持仓（get_holdings 的返回值）
+        :param target_holdings: 目标组合持仓（get_portfolio_holdings 的返回值）
+        :param target_cash_weight: 目标组合现金比例（%）
+        :param quotes: {股票代码: 股票信息}，至少包含 name, current
+        :param instruments: 提供每手股数的 InstrumentIndex，默认使用共享索引
+        """
+        plan = cls(gid, portfolio_code,
+                   total_assets=performance.get("assets", 0),
+                   cash=performance.get("cash", 0),
+                   target_cash_weight=target_cash_weight)
+
+        for h in holdings:
+            if h.get("symbol"):
+                plan.holdings[h["symbol"]] = {
+                    "shares": float(h.get("shares", 0)),
+                    "current": float(h.get("current", 0)),
+                    "name": h.get("name", ""),
+                }
+
+        if not target_holdings:
+            plan.error = "目标组合无持仓数据"
+            return plan
+
+        # 目标股数
+        for h in target_holdings:
+            symbol = h["symbol"]
+            weight = h["weight"] / 100.0  # 转换为小数
+            target_value = plan.total_assets * weight
+
+            stock_info = quotes.get(symbol)
+            if not stock_info:
+                plan.errors.append(f"找不到股票: {symbol}")
+                continue
+
+            current_price = float(stock_info.get("current") or 0)
+            if current_price <= 0:
+                plan.errors.append(f"股票价格无效: {symbol}")
+                continue
+
+            # 可转债按10张整数买入，股票按100股整数买入
+            lot = lot_size_of(symbol, stock_info, instruments)
+            target_shares = int(target_value / current_price / lot) * lot
+
+            plan.targets[symbol] = {
+                "target_shares": target_shares,
+                "target_value": target_value,
+                "current_price": current_price,
+                "name": stock_info.get("name", ""),
+                "weight": h["weight"],
+                "lot": lot,
+            }
+
+        plan._compute_orders()
+        return plan
+
+    def _compute_orders(self):
+        """根据 holdings 和 targets 重新生成卖出、买入和跳过清单"""
+        self.sells = []
+        self.buys = []
+        self.skipped = []
+
+        # 卖出：不在目标中的股票 或 需要减仓的股票
+        for symbol, holding in self.holdings.items():
+            current_shares = int(holding["shares"])
+            if symbol not in self.targets:
+                if current_shares > 0:
+                    self.sells.append({
+                        "symbol": symbol,
+                        "name": holding["name"],
+                        "shares": current_shares,
+                        "price": holding["current"],
+                        "reason": "不在目标组合中",
+                    })
+            else:
+                diff = current_shares - self.targets[symbol]["target_shares"]
+                if diff > 0:
+                    self.sells.append({
+                        "symbol": symbol,
+                        "name": holding["name"],
+                        "shares": diff,
+                        "price": holding["current"],
+                        "reason": "减仓",
+                    })
+
+        # 买入：新增或加仓的股票
+        for symbol, target in self.targets.items():
+            current_shares = int(self.holdings.get(symbol, {}).get("shares", 0))
+            diff = target["target_shares"] - current_shares
+            if diff > 0:
+                self.buys.append({
+                    "symbol": symbol,
+                    "name": target["name"],
+                    "shares": diff,
+                    "price": target["current_price"],
+                    "target_weight": target["weight"],
+                })
+            elif diff == 0:
+                self.skipped.append({
+                    "symbol": symbol,
+                    "name": target["name"],
+                    "reason": "持仓已达目标",
+                })
+
+    def optimize(self, tax_rate=0.0, commission_rate=0.0, time_budget=0.005):
+        """
+        在现金约束下按整手重新分配目标股数
+
+        逐只向下取整会留下闲置现金，也可能让买入金额超过卖出所得。这里以
+        各股票市值与目标市值之差的平方和作为跟踪误差：
+        1. 若调仓后现金为负，反复撤掉"单位释放资金带来的误差增量最小"的一手，直到现金不为负
+        2. 再用剩余现金反复加买"单位资金带来的误差减少最大"的一手，直到没有可改善的一手
+
+        第 1 步总会执行完；第 2 步超过 time_budget 时停止并保留已得到的结果。
+        卖出按持仓价、买入按目标价计算，卖出扣除佣金和税，买入加上佣金。
+
+        :param tax_rate: 税率（千分位），只对卖出收取
+        :param commission_rate: 佣金率（千分位）
+        :param time_budget: 改善阶段的最长耗时（秒）
+        :return: self
+        """
+        if self.error or not self.targets:
+            return self
+        deadline = time.perf_counter() + time_budget
+        buy_cost = 1 + commission_rate / 1000.0
+        sell_gain = 1 - (commission_rate + tax_rate) / 1000.0
+
+        # 不在目标中的持仓全部卖出
+        cash = self.cash
+        for symbol, holding in self.holdings.items():
+            if symbol not in self.targets:
+                cash += int(holding["shares"]) * holding["current"] * sell_gain
+
+        symbols = list(self.targets)
+        price = [self.targets[s]["current_price"] for s in symbols]
+        sell_price = [self.holdings[s]["current"] if s in self.holdings else price[i]
+                      for i, s in enumerate(symbols)]
+        lot = [self.targets[s].get("lot", 100) for s in symbols]
+        goal = [self.targets[s]["target_value"] for s in symbols]
+        current = [int(self.holdings.get(s, {}).get("shares", 0)) for s in symbols]
+        shares = [self.targets[s]["target_shares"] for s in symbols]
+
+        def flow(i, n):
+            """持有 n 股时该股票带来的现金变化"""
+            diff = n - current[i]
+            if diff > 0:
+                return -diff * price[i] * buy_cost
+            return -diff * sell_price[i] * sell_gain
+
+        def error(i, n):
+            return (n * price[i] - goal[i]) ** 2
+
+        for i in range(len(symbols)):
+            cash += flow(i, shares[i])
+
+        # 1. 现金不足时撤单
+        heap = []
+
+        def push_remove(i):
+            if shares[i] >= lot[i]:
+                freed = flow(i, shares[i] - lot[i]) - flow(i, shares[i])
+                if freed > 0:
+                    loss = error(i, shares[i] - lot[i]) - error(i, shares[i])
+                    heapq.heappush(heap, (loss / freed, i, shares[i]))
+
+        for i in range(len(symbols)):
+            push_remove(i)
+        while cash < 0 and heap:
+            _, i, n = heapq.heappop(heap)
+            if n != shares[i]:
+                continue
+            cash += flow(i, n - lot[i]) - flow(i, n)
+            shares[i] = n - lot[i]
+            push_remove(i)
+
+        # 2. 用剩余现金加仓
+        heap = []
+
+        def push_add(i):
+            gain = error(i, shares[i]) - error(i, shares[i] + lot[i])
+            if gain > 0:
+                cost = flow(i, shares[i]) - flow(i, shares[i] + lot[i])
+                ratio = -gain / cost if cost > 0 else float("-inf")
+                heapq.heappush(heap, (ratio, i, shares[i], cost))
+
+        for i in range(len(symbols)):
+            push_add(i)
+        while heap and time.perf_counter() < deadline:
+            _, i, n, cost = heapq.heappop(heap)
+            if n != shares[i] or cost > cash:
+                continue
+            cash -= cost
+            shares[i] = n + lot[i]
+            push_add(i)
+
+        for i, symbol in enumerate(symbols):
+            self.targets[symbol]["target_shares"] = shares[i]
+        self.cash_after = cash
+        self._compute_orders()
+        return self
+
+    def log(self):
+        """输出计划详情"""
+        if self.error:
+            logger.error("调仓计划生成失败: %s", self.error)
+            return
+        for symbol, target in self.targets.items():
+            logger.info("  %s: 目标市值 %.2f, 目标股数 %d, 当前价 %.3f",
+                        symbol, target["target_value"], target["target_shares"], target["current_price"])
+        if not self.need_sync:
+            return
+        logger.info("需要调仓:")
+        for s in self.sells:
+            logger.info("  卖出 %s: %d 股 (%s)", s["symbol"], s["shares"], s["reason"])
+        for b in self.buys:
+            logger.info("  买入 %s: %d 股", b["symbol"], b["shares"])
+
+    def to_dict(self) -> dict:
+        return {
+            "gid": self.gid,
+            "portfolio_code": self.portfolio_code,
+            "created_at": self.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            "total_assets": self.total_assets,
+            "cash": self.cash,
+            "target_cash_weight": self.target_cash_weight,
+            "targets": self.targets,
+            "sells": self.sells,
+            "buys": self.buys,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "error": self.error,
+            "cash_after": self.cash_after,
+            "need_sync": self.need_sync,
+        }
+
+    def __repr__(self):
+        return (f"<RebalancePlan gid={self.gid} portfolio={self.portfolio_code} "
+                f"sells={len(self.sells)} buys={len(self.buys)}>")
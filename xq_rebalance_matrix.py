@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+矩阵化调仓计划 - RebalanceMatrix
+
+把目标权重、价格、每手股数和各模拟仓当前股数排成对齐的数组，
+一次计算 (模拟仓 × 股票) 矩阵上的目标股数、买卖股数和资金占用。
+计算规则与 RebalancePlan.build 一致，用于持仓较多或同时同步多个模拟仓的场景。
+"""
+import numpy as np
+
+from xq_rebalance import RebalancePlan, lot_size_of
+
+
+class RebalanceMatrix:
+    """
+    对齐的股票池
+
+    前 n_targets 列为目标组合中行情有效的股票，其后为只在模拟仓中持有的股票（目标股数为 0）。
+
+    :param symbols: 股票代码列表
+    :param names: 股票名称列表
+    :param weights: 目标权重（小数）
+    :param prices: 目标价格，非目标股票为 0
+    :param lots: 每手股数
+    :param n_targets: 目标股票数
+    """
+
+    def __init__(self, symbols, names, weights, prices, lots, n_targets):
+        self.symbols = list(symbols)
+        self.names = list(names)
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.prices = np.asarray(prices, dtype=np.float64)
+        self.lots = np.asarray(lots, dtype=np.int64)
+        self.n_targets = n_targets
+        self.in_target = np.arange(len(self.symbols)) < n_targets
+
+    @classmethod
+    def from_target(cls, target_holdings, quotes, held_symbols=(), instruments=None):
+        """
+        由目标组合持仓和行情生成股票池
+
+        :param target_holdings: 目标组合持仓（get_portfolio_holdings 的返回值）
+        :param quotes: {股票代码: 股票信息}
+        :param held_symbols: 模拟仓中持有的股票代码
+        :param instruments: 提供每手股数的 InstrumentIndex，默认使用共享索引
+        :return: (RebalanceMatrix, 错误信息列表)
+        """
+        symbols, names, weights, prices, lots, errors = [], [], [], [], [], []
+        for h in target_holdings:
+            symbol = h["symbol"]
+            stock_info = quotes.get(symbol)
+            if not stock_info:
+                errors.append(f"找不到股票: {symbol}")
+                continue
+            current_price = float(stock_info.get("current") or 0)
+            if current_price <= 0:
+                errors.append(f"股票价格无效: {symbol}")
+                continue
+            symbols.append(symbol)
+            names.append(stock_info.get("name", ""))
+            weights.append(h["weight"] / 100.0)
+            prices.append(current_price)
+            lots.append(lot_size_of(symbol, stock_info, instruments))
+
+        n_targets = len(symbols)
+        known = set(symbols)
+        for symbol in held_symbols:
+            if symbol not in known:
+                known.add(symbol)
+                symbols.append(symbol)
+                names.append("")
+                weights.append(0.0)
+                prices.append(0.0)
+                lots.append(1)
+        return cls(symbols, names, weights, prices, lots, n_targets), errors
+
+    def shares_matrix(self, accounts_holdings):
+        """
+        各模拟仓当前股数矩阵
+
+        :param accounts_holdings: 每个模拟仓的持仓列表（get_holdings 的返回值）
+        :return: (股数矩阵, 持仓价格矩阵)，形状均为 (模拟仓数, 股票数)
+        """
+        shape = (len(accounts_holdings), len(self.symbols))
+        shares = np.zeros(shape, dtype=np.int64)
+        held_prices = np.zeros(shape, dtype=np.float64)
+        for row, holdings in enumerate(accounts_holdings):
+            for h in holdings:
+                col = self.index.get(h.get("symbol"))
+                if col is not None:
+                    shares[row, col] = int(float(h.get("shares", 0)))
+                    held_prices[row, col] = float(h.get("current", 0))
+        return shares, held_prices
+
+    def solve(self, total_assets, current_shares, cash=None, held_prices=None):
+        """
+        计算整个矩阵的调仓结果
+
+        :param total_assets: 各模拟仓总资产，形状 (模拟仓数,)
+        :param current_shares: 当前股数，形状 (模拟仓数, 股票数)
+        :param cash: 各模拟仓现金，提供时计算调仓后现金
+        :param held_prices: 持仓价格矩阵，卖出金额按此计算，默认使用目标价格
+        :return: dict，包含 target_shares, target_value, diff, sell_shares, buy_shares,
+                 sell_value, buy_value，以及提供 cash 时的 cash_after
+        """
+        total_assets = np.asarray(total_assets, dtype=np.float64)
+        current_shares = np.asarray(current_shares, dtype=np.int64)
+
+        # 与 RebalancePlan.build 相同的运算顺序，保证结果逐位一致
+        target_value = total_assets[:, None] * self.weights[None, :]
+        per_lot = np.divide(target_value, self.prices, out=np.zeros_like(target_value),
+                            where=self.in_target) / self.lots
+        target_shares = np.floor(per_lot).astype(np.int64) * self.lots
+
+        diff = target_shares - current_shares
+        sell_shares = np.maximum(-diff, 0)
+        buy_shares = np.maximum(diff, 0)
+
+        sell_prices = self.prices if held_prices is None else held_prices
+        result = {
+            "target_shares": target_shares,
+            "target_value": target_value,
+            "diff": diff,
+            "sell_shares": sell_shares,
+            "buy_shares": buy_shares,
+            "sell_value": (sell_shares * sell_prices).sum(axis=1),
+            "buy_value": (buy_shares * self.prices).sum(axis=1),
+        }
+        if cash is not None:
+            result["cash_after"] = np.asarray(cash, dtype=np.float64) + result["sell_value"] - result["buy_value"]
+        return result
+
+
+def build_plans(gids, portfolio_code, snapshots, target_holdings, target_cash_weight, quotes,
+                instruments=None) -> dict:
+    """
+    为多个模拟仓一次生成调仓计划，结果与逐个调用 RebalancePlan.build 相同
+
+    :param gids: 模拟仓 ID 列表
+    :param portfolio_code: 目标组合代码
+    :param snapshots: {gid: 账户快照}，包含 performance 和 holdings
+    :param target_holdings: 目标组合持仓
+    :param target_cash_weight: 目标组合现金比例（%）
+    :param quotes: {股票代码: 股票信息}
+    :param instruments: 提供每手股数的 InstrumentIndex，默认使用共享索引
+    :return: {gid: RebalancePlan}
+    """
+    plans = {}
+    for gid in gids:
+        performance = snapshots[gid]["performance"]
+        plan = RebalancePlan(gid, portfolio_code,
+                             total_assets=performance.get("assets", 0),
+                             cash=performance.get("cash", 0),
+                             target_cash_weight=target_cash_weight)
+        for h in snapshots[gid]["holdings"]:
+            if h.get("symbol"):
+                plan.holdings[h["symbol"]] = {
+                    "shares": float(h.get("shares", 0)),
+                    "current": float(h.get("current", 0)),
+                    "name": h.get("name", ""),
+                }
+        if not target_holdings:
+            plan.error = "目标组合无持仓数据"
+        plans[gid] = plan
+    if not target_holdings or not gids:
+        return plans
+
+    held_symbols = [symbol for plan in plans.values() for symbol in plan.holdings]
+    matrix, errors = RebalanceMatrix.from_target(target_holdings, quotes, held_symbols, instruments)
+    shares, _ = matrix.shares_matrix([snapshots[gid]["holdings"] for gid in gids])
+    result = matrix.solve([plans[gid].total_assets for gid in gids], shares)
+
+    target_weights = {h["symbol"]: h["weight"] for h in target_holdings}
+    target_symbols = matrix.symbols[:matrix.n_targets]
+    # 每只目标股票不随模拟仓变化的字段
+    static = [{
+        "current_price": float(matrix.prices[col]),
+        "name": matrix.names[col],
+        "weight": target_weights[symbol],
+        "lot": int(matrix.lots[col]),
+    } for col, symbol in enumerate(target_symbols)]
+    target_shares = result["target_shares"][:, :matrix.n_targets].tolist()
+    target_value = result["target_value"][:, :matrix.n_targets].tolist()
+
+    for row, gid in enumerate(gids):
+        plan = plans[gid]
+        plan.errors.extend(errors)
+        plan.targets = {
+            symbol: {"target_shares": shares_, "target_value": value, **fields}
+            for symbol, shares_, value, fields in zip(target_symbols, target_shares[row], target_value[row], static)
+        }
+        # 买卖清单与 RebalancePlan.build 使用同一个实现
+        plan._compute_orders()
+    return plans
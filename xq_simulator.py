@@ -12,15 +12,22 @@
 """
 import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-import requests
 import urllib3
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 from exceptions import TradeError
-from utils import logger, parse_cookies_str
+from xq_rebalance import RebalancePlan
+from xq_rebalance_matrix import build_plans
+from xq_ledger import ShadowLedger
+from utils import (logger, parse_cookies_str, FixedScheduler, RateLimitedSession, get_default_quote_cache,
+                   PageIterator, QuoteCache, InstrumentIndex)
+from utils.instrument_index import DEFAULT_DB_PATH as INSTRUMENT_DB_PATH
+from utils.replay import RecordingSession, ReplaySession
 
 
 class XueQiuSimulator:
@@ -42,11 +49,28 @@ class XueQiuSimulator:
         
         # 跟踪组合调仓
         simulator.sync_from_portfolio(gid=6522325211190960, portfolio_code="ZH1783962")
+    
+    演练与回放:
+        # 演练：生成完整调仓计划，但不调用下单接口
+        simulator = XueQiuSimulator(dry_run=True)
+        
+        # 录制本次访问的接口数据，之后可离线回放（回放时不访问网络，下单直接返回成功）
+        simulator = XueQiuSimulator(record_dir="tests/fixtures/my_case")
+        simulator = XueQiuSimulator(replay_dir="tests/fixtures/my_case")
     """
     
     # API 端点
     BASE_URL = "https://tc.xueqiu.com/tc/snowx/MONI"
     STOCK_SEARCH_URL = "https://xueqiu.com/query/v1/search/stock.json"
+    BATCH_QUOTE_URL = "https://stock.xueqiu.com/v5/stock/batch/quote.json"
+    
+    # 批量行情每次请求的股票数量和并发请求数
+    QUOTE_BATCH_SIZE = 50
+    QUOTE_MAX_WORKERS = 4
+    # 同步调仓时同一批次（全部卖单或全部买单）并发下单数
+    ORDER_MAX_WORKERS = 4
+    # 多模拟仓同步时并发处理的模拟仓数
+    GID_MAX_WORKERS = 4
     
     _HEADERS = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0.0.0 Safari/537.36",
@@ -60,15 +84,37 @@ class XueQiuSimulator:
         "X-Requested-With": "XMLHttpRequest",
     }
     
-    def __init__(self):
-        self.session = requests.Session()
+    def __init__(self, rate_limiter=None, quote_cache=None, instrument_index=None,
+                 dry_run=False, replay_dir=None, record_dir=None):
+        self.replay_dir = replay_dir
+        if replay_dir:
+            self.session = ReplaySession(replay_dir)
+            # 回放结果只取决于录制数据，不使用持久化的缓存
+            quote_cache = quote_cache or QuoteCache()
+            instrument_index = instrument_index or InstrumentIndex()
+        elif record_dir:
+            self.session = RecordingSession(record_dir, rate_limiter)
+        else:
+            self.session = RateLimitedSession(rate_limiter)
         self.session.verify = False
         self.session.headers.update(self._HEADERS)
         self.config = self._load_user_config()
+        self.quote_cache = quote_cache or get_default_quote_cache()
+        # 从行情和搜索接口学到的证券信息持久化到 data/instruments.db
+        self.instrument_index = instrument_index or InstrumentIndex(db_path=INSTRUMENT_DB_PATH)
+        self.dry_run = dry_run
+        
+        # 账户快照缓存 {gid: snapshot}，snapshot_ttl 为 0 时不复用
+        self.snapshot_ttl = 0
+        self._account_snapshots = {}
+        # 影子账本：下单成功后在本地更新持仓和现金，生成调仓计划时使用，定期或发现异常时才重新对账；为 None 时不使用
+        self.ledger = ShadowLedger()
         
         # 默认税率和佣金率（千分位）
         self.tax_rate = 0.5
         self.commission_rate = 0.05
+        # 生成调仓计划时是否在现金约束下按整手重新分配（计入税费）
+        self.optimize_lots = True
     
     def _load_user_config(self) -> dict:
         config_path = os.path.join(os.path.dirname(__file__), "config", "user_config.json")
@@ -82,6 +128,9 @@ class XueQiuSimulator:
         """登录（设置 cookies）"""
         if cookies is None:
             cookies = self.config.get("cookies", "")
+        if not cookies and self.replay_dir:
+            logger.info("回放模式，跳过登录")
+            return
         if not cookies:
             raise TradeError("需要设置 cookies")
         
@@ -109,72 +158,93 @@ class XueQiuSimulator:
             logger.error("获取模拟仓列表失败: %s", e)
             return []
     
-    def get_holdings(self, gid: int, period: str = "1m") -> list:
+    def get_account_snapshot(self, gid: int, max_age: float = None, use_ledger: bool = False) -> dict:
         """
-        获取模拟仓持仓（从 performances API 获取更详细持仓）
+        获取模拟仓账户快照（一次 performances 请求同时解析持仓和全市场汇总）
+        
+        use_ledger 为 True 时优先使用影子账本（self.ledger）中按成交更新的本地快照，
+        账本到了对账时间或标记为不一致时才重新请求并对账。本地快照不按行情重新计价，
+        只用于生成调仓计划；get_holdings / get_performances 总是返回服务器数据。
         
         :param gid: 模拟仓 ID
-        :param period: 时间周期
-        :return: 持仓列表
+        :param max_age: 可复用的快照最长存在时间（秒），默认使用 self.snapshot_ttl，0 表示总是重新请求
+        :param use_ledger: 是否允许使用影子账本的本地快照
+        :return: {"performance": 全市场汇总, "holdings": 持仓列表, "fetched_at": 获取时间戳}
         """
-        # 从 performances 获取更完整的持仓信息
+        force = max_age == 0
+        if max_age is None:
+            max_age = self.snapshot_ttl
+        cached = self._account_snapshots.get(gid)
+        if max_age and cached and time.time() - cached["fetched_at"] < max_age:
+            return cached
+        if use_ledger and not force and self.ledger is not None:
+            local = self.ledger.snapshot(gid)
+            if local is not None:
+                return local
+        
         url = f"{self.BASE_URL}/performances.json"
         params = {"gid": gid}
         resp = self.session.get(url, params=params)
         
+        snapshot = {"performance": {}, "holdings": [], "fetched_at": time.time()}
         try:
             result = resp.json()
-            if result.get("success"):
-                performances = result.get("result_data", {}).get("performances", [])
-                holdings = []
-                for perf in performances:
-                    market_list = perf.get("list", [])
-                    if isinstance(market_list, list):
-                        for stock in market_list:
-                            if stock.get("symbol"):
-                                holdings.append({
-                                    "symbol": stock.get("symbol"),
-                                    "name": stock.get("name"),
-                                    "shares": stock.get("shares", 0),
-                                    "current": stock.get("current", 0),
-                                    "market_value": stock.get("market_value", 0),
-                                    "float_rate": stock.get("float_rate", 0),
-                                    "cost": stock.get("hold_cost", 0),
-                                })
-                return holdings
-            else:
-                logger.error("获取持仓失败: %s", result.get("msg"))
-                return []
+            if not result.get("success"):
+                logger.error("获取模拟仓账户信息失败: %s", result.get("msg"))
+                return snapshot
+            performances = result.get("result_data", {}).get("performances", [])
         except Exception as e:
-            logger.error("获取持仓失败: %s", e)
-            return []
+            logger.error("获取模拟仓账户信息失败: %s", e)
+            return snapshot
+        
+        holdings = []
+        for perf in performances:
+            market_list = perf.get("list", [])
+            if isinstance(market_list, list):
+                for stock in market_list:
+                    if stock.get("symbol"):
+                        holdings.append({
+                            "symbol": stock.get("symbol"),
+                            "name": stock.get("name"),
+                            "shares": stock.get("shares", 0),
+                            "current": stock.get("current", 0),
+                            "market_value": stock.get("market_value", 0),
+                            "float_rate": stock.get("float_rate", 0),
+                            "cost": stock.get("hold_cost", 0),
+                        })
+        snapshot["holdings"] = holdings
+        
+        # 全市场汇总
+        summary = next((p for p in performances if p.get("market") == "ALL"), None)
+        if summary is None:
+            summary = performances[0] if performances else {}
+        snapshot["performance"] = summary
+        
+        self._account_snapshots[gid] = snapshot
+        if self.ledger is not None:
+            self.ledger.reconcile(gid, snapshot)
+        return snapshot
+    
+    def get_holdings(self, gid: int, period: str = "1m", max_age: float = None) -> list:
+        """
+        获取模拟仓持仓（从 performances API 获取更详细持仓）
+        
+        :param gid: 模拟仓 ID
+        :param period: 时间周期
+        :param max_age: 可复用的账户快照最长存在时间（秒）
+        :return: 持仓列表
+        """
+        return self.get_account_snapshot(gid, max_age=max_age)["holdings"]
     
-    def get_performances(self, gid: int) -> dict:
+    def get_performances(self, gid: int, max_age: float = None) -> dict:
         """
         获取模拟仓收益
         
         :param gid: 模拟仓 ID
+        :param max_age: 可复用的账户快照最长存在时间（秒）
         :return: 收益信息
         """
-        url = f"{self.BASE_URL}/performances.json"
-        params = {"gid": gid}
-        resp = self.session.get(url, params=params)
-        
-        try:
-            result = resp.json()
-            if result.get("success"):
-                performances = result.get("result_data", {}).get("performances", [])
-                # 返回全市场汇总
-                for p in performances:
-                    if p.get("market") == "ALL":
-                        return p
-                return performances[0] if performances else {}
-            else:
-                logger.error("获取收益失败: %s", result.get("msg"))
-                return {}
-        except Exception as e:
-            logger.error("获取收益失败: %s", e)
-            return {}
+        return self.get_account_snapshot(gid, max_age=max_age)["performance"]
     
     def search_stock(self, code: str) -> dict:
         """
@@ -183,6 +253,10 @@ class XueQiuSimulator:
         :param code: 股票代码，如 SZ123091
         :return: 股票信息
         """
+        cached = self.quote_cache.get(code)
+        if cached is not None:
+            return cached
+        
         params = {"code": code, "size": 10}
         resp = self.session.get(self.STOCK_SEARCH_URL, params=params)
         
@@ -190,12 +264,85 @@ class XueQiuSimulator:
             result = resp.json()
             stocks = result.get("stocks", [])
             if stocks:
+                self.quote_cache.put(code, stocks[0])
                 return stocks[0]
             return {}
         except Exception as e:
             logger.error("搜索股票失败: %s", e)
             return {}
     
+    def get_quotes(self, symbols: list) -> dict:
+        """
+        批量获取股票行情
+        
+        先查行情缓存，未命中的代码按 QUOTE_BATCH_SIZE 分批，各批并发请求 batch/quote.json；
+        批量接口未返回的代码再并发回退到 search_stock。
+        
+        :param symbols: 股票代码列表，如 ["SZ123091", "SH600000"]
+        :return: {股票代码: 股票信息}，股票信息至少包含 code, name, current
+        """
+        quotes = {}
+        pending = []
+        for symbol in dict.fromkeys(s for s in symbols if s):
+            cached = self.quote_cache.get(symbol)
+            if cached is not None:
+                quotes[symbol] = cached
+            else:
+                pending.append(symbol)
+        if not pending:
+            return quotes
+        
+        symbols = pending
+        batches = [symbols[i:i + self.QUOTE_BATCH_SIZE] for i in range(0, len(symbols), self.QUOTE_BATCH_SIZE)]
+        with ThreadPoolExecutor(max_workers=self.QUOTE_MAX_WORKERS) as executor:
+            for batch_quotes in executor.map(self._fetch_batch_quotes, batches):
+                for symbol, stock_info in batch_quotes.items():
+                    self._merge_quote(symbol, stock_info)
+                quotes.update(batch_quotes)
+            
+            missing = [s for s in symbols if s not in quotes]
+            if missing:
+                logger.info("批量行情缺少 %d 只，回退到搜索接口", len(missing))
+                for symbol, stock_info in zip(missing, executor.map(self.search_stock, missing)):
+                    if stock_info:
+                        quotes[symbol] = stock_info
+        return quotes
+    
+    def _merge_quote(self, symbol, stock_info):
+        """将行情写入缓存，保留缓存中搜索接口提供的 stock_id、flag 等静态字段"""
+        static = self.quote_cache.get_static(symbol)
+        if static:
+            merged = dict(static)
+            merged.update(stock_info)
+            stock_info.update(merged)
+        self.quote_cache.put(symbol, stock_info)
+    
+    def _fetch_batch_quotes(self, symbols: list) -> dict:
+        """请求一批股票的行情"""
+        params = {"symbol": ",".join(symbols), "extend": "detail"}
+        try:
+            resp = self.session.get(self.BATCH_QUOTE_URL, params=params)
+            result = resp.json()
+            items = (result.get("data") or {}).get("items") or []
+        except Exception as e:
+            logger.error("批量获取行情失败: %s", e)
+            return {}
+        
+        quotes = {}
+        for item in items:
+            quote = item.get("quote") or {}
+            symbol = quote.get("symbol")
+            if not symbol or quote.get("current") is None:
+                continue
+            quotes[symbol] = {
+                "code": symbol,
+                "name": quote.get("name", ""),
+                "current": quote.get("current"),
+                "percent": quote.get("percent", 0),
+                "type": quote.get("type"),
+            }
+        return quotes
+    
     def buy(self, gid: int, symbol: str, price: float, shares: int, 
             date: str = None, tax_rate: float = None, commission_rate: float = None) -> bool:
         """
@@ -237,6 +384,15 @@ class XueQiuSimulator:
         
         :param trade_type: 1=买入, 2=卖出
         """
+        return self._submit_trade(gid, symbol, price, shares, trade_type, date, tax_rate, commission_rate)[0]
+    
+    def _submit_trade(self, gid: int, symbol: str, price: float, shares: int, trade_type: int,
+                      date: str = None, tax_rate: float = None, commission_rate: float = None) -> tuple:
+        """
+        执行交易，同时返回失败原因
+        
+        :return: (是否成功, 失败时的错误信息)
+        """
         url = f"{self.BASE_URL}/transaction/add.json"
         
         if date is None:
@@ -246,6 +402,11 @@ class XueQiuSimulator:
         if commission_rate is None:
             commission_rate = self.commission_rate
         
+        action = "买入" if trade_type == 1 else "卖出"
+        if self.dry_run:
+            logger.info("[演练] %s: %s %d股 @ %.3f（未提交）", action, symbol, shares, price)
+            return True, None
+        
         data = {
             "type": trade_type,
             "date": date,
@@ -262,15 +423,22 @@ class XueQiuSimulator:
         try:
             result = resp.json()
             if result.get("success"):
-                action = "买入" if trade_type == 1 else "卖出"
+                # 持仓已变化，丢弃该模拟仓的账户快照，改为更新影子账本
+                self._account_snapshots.pop(gid, None)
+                if self.ledger is not None:
+                    name = (self.quote_cache.get_static(symbol) or {}).get("name")
+                    self.ledger.apply_fill(gid, symbol, price, shares, trade_type, tax_rate, commission_rate, name=name)
                 logger.info("%s成功: %s %d股 @ %.3f", action, symbol, shares, price)
-                return True
+                return True, None
             else:
                 logger.error("交易失败: %s", result.get("msg"))
-                return False
+                return False, result.get("msg") or "交易失败"
         except Exception as e:
             logger.error("交易失败: %s", e)
-            return False
+            # 无法确认是否成交，下次使用账户快照前重新对账
+            if self.ledger is not None:
+                self.ledger.mark_drift(gid)
+            return False, str(e)
     
     def get_transactions(self, gid: int, row: int = 50) -> list:
         """
@@ -295,6 +463,28 @@ class XueQiuSimulator:
             logger.error("获取交易记录失败: %s", e)
             return []
     
+    def iter_transactions(self, gid: int, page_size: int = 50, cursor: tuple = None,
+                          prefetch: bool = True) -> PageIterator:
+        """
+        按页惰性读取全部交易记录（从新到旧），内存中只保留当前页和预取的下一页
+        
+        :param gid: 模拟仓 ID
+        :param page_size: 每页记录数
+        :param cursor: 从上次迭代器的 cursor 处继续读取
+        :param prefetch: 是否在后台预取下一页
+        :return: PageIterator，读取失败时抛出 TradeError
+        """
+        url = f"{self.BASE_URL}/transaction/list.json"
+        
+        def fetch_page(page, size):
+            result = self.session.get(url, params={"gid": gid, "page": page, "row": size}).json()
+            if not result.get("success"):
+                raise TradeError(f"获取交易记录失败: {result.get('msg')}")
+            return result.get("result_data", {}).get("transactions", [])
+        
+        return PageIterator(fetch_page, page_size=page_size, cursor=cursor, prefetch=prefetch,
+                            key=lambda record: record.get("id"))
+    
     def get_portfolio_holdings(self, portfolio_code: str) -> list:
         """
         获取组合持仓（用于跟踪）
@@ -302,26 +492,141 @@ class XueQiuSimulator:
         :param portfolio_code: 组合代码
         :return: (持仓列表, 现金比例)
         """
+        return self._parse_last_rb(self.get_current_rebalance(portfolio_code))
+    
+    def get_current_rebalance(self, portfolio_code: str) -> dict:
+        """
+        获取组合当前调仓记录（current.json 中的 last_rb）
+        
+        :param portfolio_code: 组合代码
+        :return: last_rb，获取失败时返回空字典
+        """
         url = "https://xueqiu.com/cubes/rebalancing/current.json"
         params = {"cube_symbol": portfolio_code}
         resp = self.session.get(url, params=params)
         
         try:
             result = resp.json()
-            last_rb = result.get("last_rb", {})
+            return result.get("last_rb") or {}
+        except Exception as e:
+            logger.error("获取组合持仓失败: %s", e)
+            return {}
+    
+    @staticmethod
+    def _parse_last_rb(last_rb: dict):
+        """从 last_rb 解析 (持仓列表, 现金比例)"""
+        try:
             cash_weight = float(last_rb.get("cash", 0))
-            holdings = last_rb.get("holdings", [])
             holdings_list = [{
                 "symbol": h.get("stock_symbol"),
                 "name": h.get("stock_name"),
                 "weight": h.get("weight", 0),
-            } for h in holdings]
+            } for h in last_rb.get("holdings", [])]
             return holdings_list, cash_weight
         except Exception as e:
             logger.error("获取组合持仓失败: %s", e)
             return [], 0
     
-    def sync_from_portfolio(self, gid: int, portfolio_code: str) -> dict:
+    @staticmethod
+    def portfolio_fingerprint(last_rb: dict):
+        """
+        组合状态指纹：调仓记录 ID + 按代码排序的持仓权重和现金比例的哈希
+        
+        :param last_rb: get_current_rebalance 的返回值
+        :return: (调仓记录 ID, 持仓哈希)
+        """
+        weights = tuple(sorted((h.get("stock_symbol") or "", float(h.get("weight") or 0))
+                               for h in last_rb.get("holdings", [])))
+        return last_rb.get("id"), hash((weights, float(last_rb.get("cash") or 0)))
+    
+    def build_rebalance_plan(self, gid: int, portfolio_code: str) -> RebalancePlan:
+        """
+        生成调仓计划（只查询，不下单）
+        
+        :param gid: 模拟仓 ID
+        :param portfolio_code: 目标组合代码
+        :return: RebalancePlan
+        """
+        return self.build_rebalance_plans([gid], portfolio_code)[gid]
+    
+    def build_rebalance_plans(self, gids: list, portfolio_code: str, target: tuple = None) -> dict:
+        """
+        为多个模拟仓生成同一目标组合的调仓计划
+        
+        目标组合持仓和行情只查询一次，各模拟仓账户快照并发查询，
+        多个模拟仓时目标股数按 (模拟仓 × 股票) 矩阵一次计算；optimize_lots 为 True 时
+        再按现金和税费约束逐个模拟仓调整整手数量
+        
+        :param gids: 模拟仓 ID 列表
+        :param portfolio_code: 目标组合代码
+        :param target: 已获取的目标组合 (持仓列表, 现金比例)，不提供时查询 current.json
+        :return: {gid: RebalancePlan}
+        """
+        if not gids:
+            return {}
+        if target is None:
+            target = self.get_portfolio_holdings(portfolio_code)
+        target_holdings, target_cash_weight = target
+        symbols = [h["symbol"] for h in target_holdings]
+        quotes = self.get_quotes(symbols)
+        # 证券信息索引中没有的代码先用行情学习，行情也没有时再查搜索接口
+        self.instrument_index.resolve(symbols, lambda symbol: quotes.get(symbol) or self.search_stock(symbol))
+        
+        with ThreadPoolExecutor(max_workers=min(self.GID_MAX_WORKERS, len(gids))) as executor:
+            snapshots = dict(zip(gids, executor.map(lambda gid: self.get_account_snapshot(gid, use_ledger=True), gids)))
+        
+        if len(gids) == 1:
+            # 单个模拟仓逐只计算更快，矩阵只在多个模拟仓时才有收益
+            gid = gids[0]
+            plans = {gid: RebalancePlan.build(gid, portfolio_code, snapshots[gid]["performance"], snapshots[gid]["holdings"],
+                                              target_holdings, target_cash_weight, quotes, instruments=self.instrument_index)}
+        else:
+            plans = build_plans(gids, portfolio_code, snapshots, target_holdings, target_cash_weight, quotes,
+                                instruments=self.instrument_index)
+        if self.optimize_lots:
+            for plan in plans.values():
+                plan.optimize(self.tax_rate, self.commission_rate)
+        return plans
+    
+    def sync_many(self, gids: list, portfolio_code: str, plans: dict = None) -> dict:
+        """
+        将同一目标组合同步到多个模拟仓
+        
+        目标组合只查询一次，各模拟仓的调仓并发执行
+        
+        :param gids: 模拟仓 ID 列表
+        :param portfolio_code: 目标组合代码
+        :param plans: 已生成的 {gid: RebalancePlan}，不提供时自动生成
+        :return: {gid: 调仓结果}，结果格式同 sync_from_portfolio
+        """
+        if not gids:
+            return {}
+        if plans is None:
+            plans = self.build_rebalance_plans(gids, portfolio_code)
+        
+        def sync_one(gid):
+            try:
+                return self.sync_from_portfolio(gid, portfolio_code, plan=plans[gid])
+            except Exception as e:
+                logger.exception("模拟仓 %s 同步失败: %s", gid, e)
+                return {"error": str(e), "plan": plans[gid]}
+        
+        with ThreadPoolExecutor(max_workers=min(self.GID_MAX_WORKERS, len(gids))) as executor:
+            results = dict(zip(gids, executor.map(sync_one, gids)))
+        
+        logger.info("=" * 50)
+        logger.info("多模拟仓同步汇总 (%s -> %d 个模拟仓):", portfolio_code, len(gids))
+        for gid, result in results.items():
+            if "summary" in result:
+                logger.info("  %s: 买入 %d 笔, 卖出 %d 笔, 错误 %d 条", gid,
+                           result["summary"]["buy_count"], result["summary"]["sell_count"],
+                           result["summary"]["error_count"])
+            else:
+                logger.info("  %s: 失败 - %s", gid, result.get("error"))
+        logger.info("=" * 50)
+        return results
+    
+    def sync_from_portfolio(self, gid: int, portfolio_code: str, plan: RebalancePlan = None) -> dict:
         """
         根据组合持仓同步调仓模拟仓
         
@@ -330,158 +635,56 @@ class XueQiuSimulator:
         2. 获取目标组合的持仓比例
         3. 计算每只股票的目标市值 = 总资产 × 权重比例
         4. 计算目标股数 = 目标市值 / 当前股价（可转债取整到10张）
+           optimize_lots 为 True 时再在现金和税费约束下按整手调整，减少闲置现金
         5. 对比当前持仓，计算需要买入/卖出的股数
         6. 先卖后买，执行交易
         
         :param gid: 模拟仓 ID
         :param portfolio_code: 要跟踪的组合代码
-        :return: 调仓结果
+        :param plan: 已生成的调仓计划（如 check_need_sync 返回的），提供时跳过 1-5 步直接执行
+        :return: 调仓结果，其中 plan 为本次执行的调仓计划
         """
         logger.info("=" * 50)
         logger.info("开始同步组合 %s 到模拟仓 %d", portfolio_code, gid)
         logger.info("=" * 50)
         
-        # 1. 获取模拟仓当前资产和持仓
-        perf = self.get_performances(gid)
-        total_assets = perf.get("assets", 0)
-        current_cash = perf.get("cash", 0)
-        
-        logger.info("模拟仓总资产: %.2f, 现金: %.2f", total_assets, current_cash)
+        # 1-5. 生成调仓计划
+        if plan is None:
+            plan = self.build_rebalance_plan(gid, portfolio_code)
         
-        # 获取当前模拟仓持仓
-        sim_holdings = self.get_holdings(gid)
-        sim_holdings_map = {}
-        for h in sim_holdings:
-            if h.get("symbol"):
-                sim_holdings_map[h["symbol"]] = {
-                    "shares": float(h.get("shares", 0)),
-                    "current": float(h.get("current", 0)),
-                    "name": h.get("name", ""),
-                }
+        logger.info("模拟仓总资产: %.2f, 现金: %.2f", plan.total_assets, plan.cash)
+        logger.info("当前模拟仓持仓: %s", list(plan.holdings.keys()) if plan.holdings else "空仓")
         
-        logger.info("当前模拟仓持仓: %s", list(sim_holdings_map.keys()) if sim_holdings_map else "空仓")
+        if plan.error:
+            logger.error(plan.error)
+            return {"error": plan.error, "plan": plan}
         
-        # 2. 获取目标组合持仓和现金比例
-        target_holdings, target_cash_weight = self.get_portfolio_holdings(portfolio_code)
-        
-        if not target_holdings:
-            logger.error("目标组合无持仓数据")
-            return {"error": "目标组合无持仓数据"}
-        
-        logger.info("目标组合现金比例: %.2f%%", target_cash_weight)
+        logger.info("目标组合现金比例: %.2f%%", plan.target_cash_weight)
         logger.info("目标组合持仓:")
-        for h in target_holdings:
-            logger.info("  %s (%s): %.2f%%", h["name"], h["symbol"], h["weight"])
-        
-        # 3. 计算目标持仓
-        results = {"buys": [], "sells": [], "errors": [], "skipped": []}
-        target_map = {}
+        for symbol, target in plan.targets.items():
+            logger.info("  %s (%s): %.2f%%", target["name"], symbol, target["weight"])
+        plan.log()
         
-        for h in target_holdings:
-            symbol = h["symbol"]
-            weight = h["weight"] / 100.0  # 转换为小数
-            target_value = total_assets * weight
-            
-            # 获取当前股价
-            stock_info = self.search_stock(symbol)
-            if not stock_info:
-                results["errors"].append(f"找不到股票: {symbol}")
-                continue
-            
-            current_price = float(stock_info.get("current", 0))
-            if current_price <= 0:
-                results["errors"].append(f"股票价格无效: {symbol}")
-                continue
-            
-            # 可转债按10张整数买入（1张=10股面值）
-            # 雪球模拟仓中可转债以"张"为单位，但接口用股数表示
-            if "转债" in stock_info.get("name", ""):
-                # 可转债：按张计算，1张 = 1股（在雪球中）
-                target_shares = int(target_value / current_price / 10) * 10
-            else:
-                # 股票：按100股整数
-                target_shares = int(target_value / current_price / 100) * 100
-            
-            target_map[symbol] = {
-                "target_shares": target_shares,
-                "target_value": target_value,
-                "current_price": current_price,
-                "name": stock_info.get("name", ""),
-                "weight": h["weight"],
-            }
-            
-            logger.info("  %s: 目标市值 %.2f, 目标股数 %d, 当前价 %.3f", 
-                       symbol, target_value, target_shares, current_price)
+        results = {"buys": [], "sells": [], "errors": list(plan.errors), "skipped": list(plan.skipped)}
         
-        # 4. 先卖出：不在目标中的股票 或 需要减仓的股票
+        # 6. 先并发卖出，全部卖单完成后再并发买入
         logger.info("-" * 30)
         logger.info("执行卖出操作...")
+        results["sells"] = self._execute_orders(gid, plan.sells, trade_type=2)
         
-        for symbol, holding in sim_holdings_map.items():
-            current_shares = int(holding["shares"])
-            
-            if symbol not in target_map:
-                # 股票不在目标中，全部卖出
-                if current_shares > 0:
-                    logger.info("卖出（清仓）: %s %d股 @ %.3f", symbol, current_shares, holding["current"])
-                    success = self.sell(gid, symbol, holding["current"], current_shares)
-                    results["sells"].append({
-                        "symbol": symbol,
-                        "name": holding["name"],
-                        "shares": current_shares,
-                        "price": holding["current"],
-                        "success": success,
-                        "reason": "不在目标组合中",
-                    })
-            else:
-                # 股票在目标中，检查是否需要减仓
-                target_shares = target_map[symbol]["target_shares"]
-                diff = current_shares - target_shares
-                
-                if diff > 0:
-                    logger.info("卖出（减仓）: %s %d股 @ %.3f", symbol, diff, holding["current"])
-                    success = self.sell(gid, symbol, holding["current"], diff)
-                    results["sells"].append({
-                        "symbol": symbol,
-                        "name": holding["name"],
-                        "shares": diff,
-                        "price": holding["current"],
-                        "success": success,
-                        "reason": "减仓",
-                    })
-        
-        # 5. 再买入：新增或加仓的股票
         logger.info("-" * 30)
         logger.info("执行买入操作...")
+        results["buys"] = self._execute_orders(gid, plan.buys, trade_type=1)
         
-        for symbol, target in target_map.items():
-            current_shares = sim_holdings_map.get(symbol, {}).get("shares", 0)
-            target_shares = target["target_shares"]
-            diff = target_shares - int(current_shares)
-            
-            if diff > 0:
-                logger.info("买入: %s %d股 @ %.3f (目标权重 %.2f%%)", 
-                           symbol, diff, target["current_price"], target["weight"])
-                success = self.buy(gid, symbol, target["current_price"], diff)
-                results["buys"].append({
-                    "symbol": symbol,
-                    "name": target["name"],
-                    "shares": diff,
-                    "price": target["current_price"],
-                    "success": success,
-                    "target_weight": target["weight"],
-                })
-            elif diff == 0:
-                results["skipped"].append({
-                    "symbol": symbol,
-                    "name": target["name"],
-                    "reason": "持仓已达目标",
-                })
-        
-        # 6. 查询交易记录确认
+        # 成交已记入影子账本；没有账本或有订单结果不确定时才查询服务器交易记录确认
         logger.info("-" * 30)
-        logger.info("调仓完成，查询最新交易记录...")
-        transactions = self.get_transactions(gid, row=20)
+        if self.dry_run:
+            transactions = []
+        elif self.ledger is not None and not self.ledger.is_drifted(gid):
+            transactions = self.ledger.recent_fills(gid)
+        else:
+            logger.info("调仓完成，查询最新交易记录...")
+            transactions = self.get_transactions(gid, row=20)
         
         # 统计结果
         buy_count = sum(1 for b in results["buys"] if b["success"])
@@ -492,15 +695,49 @@ class XueQiuSimulator:
         logger.info("=" * 50)
         
         results["summary"] = {
-            "total_assets": total_assets,
+            "total_assets": plan.total_assets,
             "buy_count": buy_count,
             "sell_count": sell_count,
             "error_count": len(results["errors"]),
         }
         results["recent_transactions"] = transactions[:10]
+        results["plan"] = plan
+        results["dry_run"] = self.dry_run
         
         return results
     
+    def _execute_orders(self, gid: int, orders: list, trade_type: int) -> list:
+        """
+        并发提交同一方向的一批订单，全部完成后返回（作为先卖后买的屏障）
+        
+        单笔失败或异常只记录在该笔结果中，不影响其他订单
+        
+        :param trade_type: 1=买入, 2=卖出
+        :return: 与 orders 顺序一致的结果列表，每项增加 success, latency, error
+        """
+        if not orders:
+            return []
+        
+        def submit(order):
+            if trade_type == 2:
+                logger.info("卖出（%s）: %s %d股 @ %.3f", order["reason"], order["symbol"], order["shares"], order["price"])
+            else:
+                logger.info("买入: %s %d股 @ %.3f (目标权重 %.2f%%)",
+                           order["symbol"], order["shares"], order["price"], order["target_weight"])
+            start = time.monotonic()
+            try:
+                success, error = self._submit_trade(gid, order["symbol"], order["price"], order["shares"], trade_type)
+            except Exception as e:
+                logger.error("下单异常 %s: %s", order["symbol"], e)
+                success = False
+                error = str(e)
+                if self.ledger is not None:
+                    self.ledger.mark_drift(gid)
+            return dict(order, success=success, latency=time.monotonic() - start, error=error)
+        
+        with ThreadPoolExecutor(max_workers=min(self.ORDER_MAX_WORKERS, len(orders))) as executor:
+            return list(executor.map(submit, orders))
+    
     def get_portfolio_rebalance_history(self, portfolio_code: str, count: int = 5) -> list:
         """
         获取组合的调仓历史记录
@@ -520,48 +757,79 @@ class XueQiuSimulator:
             logger.error("获取调仓历史失败: %s", e)
             return []
     
-    def auto_track_and_sync(self, gid: int, portfolio_code: str, 
-                            interval: int = 60, max_iterations: int = None):
+    def iter_portfolio_rebalance_history(self, portfolio_code: str, page_size: int = 20, cursor: tuple = None,
+                                         prefetch: bool = True) -> PageIterator:
+        """
+        按页惰性读取组合全部调仓历史（从新到旧）
+        
+        :param portfolio_code: 组合代码
+        :param page_size: 每页记录数
+        :param cursor: 从上次迭代器的 cursor 处继续读取
+        :param prefetch: 是否在后台预取下一页
+        :return: PageIterator
+        """
+        url = "https://xueqiu.com/cubes/rebalancing/history.json"
+        
+        def fetch_page(page, size):
+            params = {"cube_symbol": portfolio_code, "count": size, "page": page}
+            return self.session.get(url, params=params).json().get("list", [])
+        
+        return PageIterator(fetch_page, page_size=page_size, cursor=cursor, prefetch=prefetch,
+                            key=lambda record: record.get("id"))
+    
+    def _fingerprint_or_history(self, portfolio_code: str, last_rb: dict):
+        """
+        计算组合指纹；current.json 没有返回调仓记录时才请求 history.json 取最新调仓记录 ID
+        
+        :param last_rb: get_current_rebalance 的返回值
+        """
+        if last_rb:
+            return self.portfolio_fingerprint(last_rb)
+        history = self.get_portfolio_rebalance_history(portfolio_code, count=1)
+        return (history[0].get("id") if history else None), None
+    
+    def auto_track_and_sync(self, gid, portfolio_code: str, 
+                            interval: int = 60, max_iterations: int = None, scheduler=None):
         """
         自动跟踪组合变化并同步到模拟仓
         
-        监控目标组合的调仓记录，当检测到新的调仓时自动同步模拟仓
+        监控目标组合的调仓记录，当检测到新的调仓时自动同步模拟仓。
+        每轮只请求一次 current.json，由调仓记录 ID 和持仓权重计算指纹判断是否变化，
+        变化时直接用这次返回的持仓生成调仓计划。
+        传入多个模拟仓时目标组合每轮只轮询一次，各模拟仓并发调仓。
         
-        :param gid: 模拟仓 ID
+        :param gid: 模拟仓 ID，或模拟仓 ID 列表
         :param portfolio_code: 要跟踪的组合代码
         :param interval: 轮询间隔（秒）
         :param max_iterations: 最大轮询次数（None表示无限循环）
+        :param scheduler: 轮询调度器（如 utils.PollScheduler），默认按 interval 固定间隔轮询
         """
-        import time
+        if scheduler is None:
+            scheduler = FixedScheduler(interval, error_delay=interval)
+        gids = list(gid) if isinstance(gid, (list, tuple)) else [gid]
+        if not gids:
+            logger.warning("没有需要同步的模拟仓，跳过自动跟踪")
+            return
         
         logger.info("=" * 60)
         logger.info("启动自动跟踪同步")
-        logger.info("  模拟仓 GID: %d", gid)
+        logger.info("  模拟仓 GID: %s", ", ".join(str(g) for g in gids))
         logger.info("  跟踪组合: %s", portfolio_code)
         logger.info("  轮询间隔: %d 秒", interval)
         logger.info("=" * 60)
         
-        # 记录上次调仓时间
-        last_rebalance_id = None
-        
-        # 记录上次持仓快照
-        last_holdings_snapshot = None
+        # 轮询之间只保留目标组合的指纹
+        last_rb = self.get_current_rebalance(portfolio_code)
+        last_fingerprint = self._fingerprint_or_history(portfolio_code, last_rb)
+        logger.info("初始调仓记录 ID: %s", last_fingerprint[0])
         
-        # 首次同步
+        # 首次同步（直接使用刚获取的目标组合持仓）
         logger.info("\n首次同步...")
-        result = self.sync_from_portfolio(gid, portfolio_code)
-        
-        # 获取初始调仓记录ID
-        history = self.get_portfolio_rebalance_history(portfolio_code, count=1)
-        if history:
-            last_rebalance_id = history[0].get("id")
-            logger.info("初始调仓记录 ID: %s", last_rebalance_id)
-        
-        # 获取初始持仓快照
-        target_holdings, _ = self.get_portfolio_holdings(portfolio_code)
-        last_holdings_snapshot = {h["symbol"]: h["weight"] for h in target_holdings}
+        target = self._parse_last_rb(last_rb) if last_rb else None
+        self.sync_many(gids, portfolio_code, plans=self.build_rebalance_plans(gids, portfolio_code, target=target))
         
         iteration = 0
+        errors = 0
         try:
             while True:
                 iteration += 1
@@ -572,61 +840,54 @@ class XueQiuSimulator:
                 logger.info("\n[%s] 轮询检查中... (第 %d 次)", 
                            datetime.now().strftime("%H:%M:%S"), iteration)
                 
-                # 方法1：检查调仓历史记录
-                history = self.get_portfolio_rebalance_history(portfolio_code, count=1)
-                new_rebalance = False
-                
-                if history:
-                    current_rebalance_id = history[0].get("id")
-                    if current_rebalance_id != last_rebalance_id:
-                        logger.info("检测到新的调仓记录！ID: %s", current_rebalance_id)
-                        new_rebalance = True
-                        last_rebalance_id = current_rebalance_id
+                try:
+                    # 每轮只请求 current.json，比较调仓记录 ID 和持仓权重的指纹
+                    last_rb = self.get_current_rebalance(portfolio_code)
+                    fingerprint = self._fingerprint_or_history(portfolio_code, last_rb)
+                    if fingerprint[1] is None:
+                        # current.json 未返回持仓时只比较调仓记录 ID
+                        fingerprint = (fingerprint[0], last_fingerprint[1])
+                    new_rebalance = False
                 
-                # 方法2：检查持仓比例是否变化
-                if not new_rebalance:
-                    current_holdings, _ = self.get_portfolio_holdings(portfolio_code)
-                    current_snapshot = {h["symbol"]: h["weight"] for h in current_holdings}
-                    
-                    # 比较持仓
-                    if current_snapshot != last_holdings_snapshot:
-                        logger.info("检测到持仓比例变化！")
-                        
-                        # 详细显示变化
-                        for symbol in set(list(current_snapshot.keys()) + list(last_holdings_snapshot.keys())):
-                            old_weight = last_holdings_snapshot.get(symbol, 0)
-                            new_weight = current_snapshot.get(symbol, 0)
-                            if old_weight != new_weight:
-                                logger.info("  %s: %.2f%% -> %.2f%%", symbol, old_weight, new_weight)
-                        
+                    if fingerprint != last_fingerprint:
+                        if fingerprint[0] != last_fingerprint[0]:
+                            logger.info("检测到新的调仓记录！ID: %s", fingerprint[0])
+                        else:
+                            logger.info("检测到持仓比例变化！")
                         new_rebalance = True
-                        last_holdings_snapshot = current_snapshot
+                        last_fingerprint = fingerprint
                 
-                # 如果检测到变化，先判断是否真正需要调仓
-                if new_rebalance:
-                    logger.info("\n检测到目标组合变化，检查是否需要调仓...")
+                    # 如果检测到变化，先判断是否真正需要调仓
+                    if new_rebalance:
+                        logger.info("\n检测到目标组合变化，检查是否需要调仓...")
                     
-                    need_sync, trade_info = self.check_need_sync(gid, portfolio_code)
+                        target = self._parse_last_rb(last_rb) if last_rb else None
+                        plans = self.build_rebalance_plans(gids, portfolio_code, target=target)
+                        for plan in plans.values():
+                            plan.log()
+                        pending = {g: p for g, p in plans.items() if p.need_sync}
                     
-                    if need_sync:
-                        logger.info("\n" + "=" * 50)
-                        logger.info("需要调仓！开始自动同步...")
-                        logger.info("=" * 50)
+                        if pending:
+                            logger.info("\n" + "=" * 50)
+                            logger.info("需要调仓！开始自动同步 %d 个模拟仓...", len(pending))
+                            logger.info("=" * 50)
                         
-                        result = self.sync_from_portfolio(gid, portfolio_code)
-                        
-                        if "summary" in result:
-                            logger.info("\n同步完成: 买入 %d 笔, 卖出 %d 笔", 
-                                       result["summary"]["buy_count"], 
-                                       result["summary"]["sell_count"])
+                            # 直接执行检查时生成的计划，不再重复查询
+                            self.sync_many(list(pending), portfolio_code, plans=pending)
+                        else:
+                            logger.info("模拟仓已与目标一致，无需调仓")
                     else:
-                        logger.info("模拟仓已与目标一致，无需调仓")
-                else:
-                    logger.info("未检测到变化，继续等待...")
+                        logger.info("未检测到变化，继续等待...")
+                
+                    errors = 0
+                except Exception as e:
+                    errors += 1
+                    logger.exception("轮询检查失败 (连续第 %d 次): %s", errors, e)
                 
                 # 等待下一次轮询
-                logger.info("等待 %d 秒后再次检查...", interval)
-                time.sleep(interval)
+                delay = scheduler.next_delay(errors)
+                logger.info("等待 %.0f 秒后再次检查...", delay)
+                time.sleep(delay)
                 
         except KeyboardInterrupt:
             logger.info("\n用户中断，停止跟踪")
@@ -639,75 +900,8 @@ class XueQiuSimulator:
         
         :param gid: 模拟仓 ID
         :param portfolio_code: 目标组合代码
-        :return: (是否需要同步, 交易详情)
-        """
-        # 获取模拟仓当前持仓
-        perf = self.get_performances(gid)
-        total_assets = perf.get("assets", 0)
-        
-        sim_holdings = self.get_holdings(gid)
-        sim_holdings_map = {}
-        for h in sim_holdings:
-            if h.get("symbol"):
-                sim_holdings_map[h["symbol"]] = float(h.get("shares", 0))
-        
-        # 获取目标组合持仓
-        target_holdings, _ = self.get_portfolio_holdings(portfolio_code)
-        
-        buys_needed = []
-        sells_needed = []
-        
-        # 计算每只股票的目标股数
-        target_map = {}
-        for h in target_holdings:
-            symbol = h["symbol"]
-            weight = h["weight"] / 100.0
-            target_value = total_assets * weight
-            
-            # 获取当前股价
-            stock_info = self.search_stock(symbol)
-            if not stock_info:
-                continue
-            
-            current_price = float(stock_info.get("current", 0))
-            if current_price <= 0:
-                continue
-            
-            # 计算目标股数
-            if "转债" in stock_info.get("name", ""):
-                target_shares = int(target_value / current_price / 10) * 10
-            else:
-                target_shares = int(target_value / current_price / 100) * 100
-            
-            target_map[symbol] = target_shares
-        
-        # 比较：需要卖出的
-        for symbol, current_shares in sim_holdings_map.items():
-            current_shares = int(current_shares)
-            if symbol not in target_map:
-                if current_shares > 0:
-                    sells_needed.append({"symbol": symbol, "shares": current_shares, "reason": "清仓"})
-            else:
-                target_shares = target_map[symbol]
-                diff = current_shares - target_shares
-                if diff > 0:
-                    sells_needed.append({"symbol": symbol, "shares": diff, "reason": "减仓"})
-        
-        # 比较：需要买入的
-        for symbol, target_shares in target_map.items():
-            current_shares = int(sim_holdings_map.get(symbol, 0))
-            diff = target_shares - current_shares
-            if diff > 0:
-                buys_needed.append({"symbol": symbol, "shares": diff})
-        
-        need_sync = len(buys_needed) > 0 or len(sells_needed) > 0
-        
-        if need_sync:
-            logger.info("需要调仓:")
-            for s in sells_needed:
-                logger.info("  卖出 %s: %d 股 (%s)", s["symbol"], s["shares"], s["reason"])
-            for b in buys_needed:
-                logger.info("  买入 %s: %d 股", b["symbol"], b["shares"])
-        
-        return need_sync, {"buys": buys_needed, "sells": sells_needed}
-
+        :return: (是否需要同步, 交易详情)，交易详情中的 plan 可直接传给 sync_from_portfolio
+        """
+        plan = self.build_rebalance_plan(gid, portfolio_code)
+        plan.log()
+        return plan.need_sync, {"buys": plan.buys, "sells": plan.sells, "plan": plan}
@@ -7,23 +7,180 @@
 import json
 import numbers
 import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from types import MappingProxyType
 
-import requests
 import urllib3
 
 # 禁用 HTTPS 证书验证警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 from exceptions import TradeError, ConfigError
-from utils import logger, parse_cookies_str
+from utils import logger, parse_cookies_str, RateLimitedSession, get_default_quote_cache, PageIterator
+
+
+class PortfolioSnapshot(namedtuple("PortfolioSnapshot", "portfolio_code holdings cash net_value fetched_at")):
+    """
+    组合快照（不可变）
+
+    一次 current.json + quote.json 的结果，余额、持仓、现金比例都从同一个快照计算。
+
+    :param portfolio_code: 组合代码
+    :param holdings: 持仓（只读字典的元组，字段同 current.json 中 last_rb.holdings）
+    :param cash: 现金比例（%）
+    :param net_value: 组合净值
+    :param fetched_at: 获取时间戳
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_info(cls, portfolio_code, portfolio_info, fetched_at=None):
+        last_rb = portfolio_info["last_rb"]
+        return cls(
+            portfolio_code=portfolio_code,
+            holdings=tuple(MappingProxyType(dict(h)) for h in last_rb["holdings"]),
+            cash=float(last_rb["cash"]),
+            net_value=float(portfolio_info["net_value"]),
+            fetched_at=time.time() if fetched_at is None else fetched_at,
+        )
+
+    def positions(self) -> list:
+        """持仓的可修改副本（用于组装调仓请求）"""
+        return [dict(h) for h in self.holdings]
+
+    def age(self, now=None) -> float:
+        return (time.time() if now is None else now) - self.fetched_at
+
+
+class Position:
+    """
+    持仓表中一条持仓的只读视图，字段保存在 PositionBook 的持仓列表中
+
+    :param fields: 调仓请求格式的持仓字典
+    """
+    __slots__ = ("fields",)
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    @property
+    def stock_id(self):
+        return self.fields["stock_id"]
+
+    @property
+    def symbol(self) -> str:
+        return str(self.fields.get("stock_symbol") or self.fields.get("code") or "").upper()
+
+    @property
+    def weight(self) -> float:
+        return self.fields.get("weight", 0)
+
+
+class PositionBook:
+    """
+    调仓用的持仓表
+
+    在调仓请求格式的持仓列表上按 stock_id 建立索引，查找和修改权重不再遍历整个列表；
+    修改直接写回列表中的字典，提交时直接序列化该列表。
+    权重合计以 0.01% 为单位的整数增量维护，现金比例不需要每次重新求和。
+
+    :param positions: 持仓列表（如 XueQiuTrader.position_list），不复制，修改会反映到该列表
+    """
+    __slots__ = ("_list", "_index", "_symbols", "_weight_units")
+
+    def __init__(self, positions=None):
+        self._list = positions if positions is not None else []
+        # stock_id -> 持仓字典
+        self._index = {p["stock_id"]: p for p in self._list}
+        # 股票代码 -> stock_id，第一次 find 时建立
+        self._symbols = None
+        self._weight_units = round(sum(p.get("weight", 0) or 0 for p in self._list) * 100)
+
+    @classmethod
+    def from_snapshot(cls, snapshot: PortfolioSnapshot) -> "PositionBook":
+        return cls(snapshot.positions())
+
+    def __len__(self):
+        return len(self._list)
+
+    def __iter__(self):
+        return (Position(p) for p in self._list)
+
+    def __contains__(self, stock_id):
+        return stock_id in self._index
+
+    def get(self, stock_id):
+        fields = self._index.get(stock_id)
+        return None if fields is None else Position(fields)
+
+    def find(self, symbol):
+        """按股票代码查找持仓"""
+        if self._symbols is None:
+            self._symbols = {Position(p).symbol: p["stock_id"] for p in self._list}
+        stock_id = self._symbols.get(str(symbol).upper())
+        return None if stock_id is None else self.get(stock_id)
+
+    def add(self, fields, weight, proactive=True) -> Position:
+        """新增持仓，已存在时只修改权重"""
+        if fields["stock_id"] in self._index:
+            self.set_weight(fields["stock_id"], weight, proactive)
+            return self.get(fields["stock_id"])
+        fields["weight"] = weight
+        if proactive:
+            fields["proactive"] = True
+        self._list.append(fields)
+        self._index[fields["stock_id"]] = fields
+        if self._symbols is not None:
+            self._symbols[Position(fields).symbol] = fields["stock_id"]
+        self._weight_units += round((weight or 0) * 100)
+        return Position(fields)
+
+    def set_weight(self, stock_id, weight, proactive=True):
+        fields = self._index[stock_id]
+        self._weight_units += round((weight or 0) * 100) - round((fields.get("weight", 0) or 0) * 100)
+        if proactive:
+            fields["proactive"] = True
+        fields["weight"] = weight
+
+    @property
+    def weight_total(self) -> float:
+        """持仓权重合计（%）"""
+        return self._weight_units / 100
+
+    @property
+    def cash(self) -> float:
+        """剩余现金比例（%）"""
+        return (10000 - self._weight_units) / 100
+
+    def is_stale(self) -> bool:
+        """列表在索引之外增删过持仓时需要重建"""
+        return len(self._index) != len(self._list)
+
+    def to_list(self) -> list:
+        """持仓列表本身（不复制）"""
+        return self._list
+
+    def to_json(self) -> str:
+        return json.dumps(self._list)
 
 
 class XueQiuTrader:
     """
     雪球组合交易类
+    
+    余额、持仓和现金比例都基于组合快照（PortfolioSnapshot）计算。默认每次调用获取一次新快照；
+    设置 snapshot_max_age（秒）后，在有效期内的多次调用复用同一个快照，调仓成功后快照失效。
     """
     
     CONFIG_PATH = os.path.join(os.path.dirname(__file__), "config", "xq.json")
+    # 批量查询组合时并发请求 current.json 的线程数
+    PORTFOLIO_MAX_WORKERS = 4
+    # 每次 quote.json 请求最多查询的组合数
+    QUOTE_BATCH_SIZE = 50
+    # 扫描大量组合时同时在途的请求数，实际速率仍由限流器控制
+    SCAN_MAX_WORKERS = 16
     
     _HEADERS = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0.0.0 Safari/537.36",
@@ -38,19 +195,26 @@ class XueQiuTrader:
         "X-Requested-With": "XMLHttpRequest",
     }
     
-    def __init__(self, initial_assets: int = 1000000):
+    def __init__(self, initial_assets: int = 1000000, rate_limiter=None, quote_cache=None):
         self.multiple = initial_assets
         if not isinstance(self.multiple, numbers.Number):
             raise TypeError("initial_assets 必须是数字类型")
         if self.multiple < 1e3:
             raise ValueError(f"雪球初始资产不能小于1000元")
         
-        self.session = requests.Session()
+        self.session = RateLimitedSession(rate_limiter)
         self.session.verify = False
         self.session.headers.update(self._HEADERS)
         self.account_config = None
-        self.position_list = []
+        # adjust_weight 使用的持仓列表，以及 fetch_position=False 连续调仓时在其上保留的索引
+        self._position_list = []
+        self._position_book = None
         self.config = self._load_config()
+        self.quote_cache = quote_cache or get_default_quote_cache()
+        
+        # 组合快照复用的有效期（秒），0 表示每次调用都重新获取
+        self.snapshot_max_age = 0
+        self._snapshot = None
     
     def _load_config(self) -> dict:
         if not os.path.exists(self.CONFIG_PATH):
@@ -80,21 +244,21 @@ class XueQiuTrader:
         return virtual * self.multiple
     
     def _search_stock_info(self, code: str) -> dict:
+        cached = self.quote_cache.get(code)
+        # 交易端需要 stock_id 和 flag，只含行情字段的缓存不可用
+        if cached is not None and "stock_id" in cached:
+            return cached
         params = {"code": str(code), "size": "300", "key": "47bce5c74f", "market": self.account_config["portfolio_market"]}
         resp = self.session.get(self.config["search_stock_url"], params=params)
         stocks = resp.json()
         if "stocks" in stocks and len(stocks["stocks"]) > 0:
+            self.quote_cache.put(code, stocks["stocks"][0])
             return stocks["stocks"][0]
         return None
     
     def _get_portfolio_info(self, portfolio_code: str) -> dict:
-        params_rb = {"cube_symbol": portfolio_code}
-        resp_rb = self.session.get(self.config["portfolio_url_new"], params=params_rb)
-        params_qt = {"code": portfolio_code}
-        resp_qt = self.session.get(self.config["portfolio_quote"], params=params_qt)
         try:
-            rebalance_info = resp_rb.json()
-            quote_info = resp_qt.json()
+            rebalance_info, quote_info = self._fetch_portfolio_and_quote(portfolio_code)
             net_value = quote_info[portfolio_code]["net_value"]
             portfolio_info = rebalance_info
             portfolio_info["net_value"] = net_value
@@ -102,31 +266,83 @@ class XueQiuTrader:
             raise TradeError(f"获取组合信息失败: {e}")
         return portfolio_info
     
-    def get_balance(self) -> list:
-        portfolio_code = self.account_config.get("portfolio_code")
-        portfolio_info = self._get_portfolio_info(portfolio_code)
-        asset_balance = self._virtual_to_balance(float(portfolio_info["net_value"]))
-        position = portfolio_info["last_rb"]
-        cash = asset_balance * float(position["cash"]) / 100
+    def _fetch_portfolio_and_quote(self, portfolio_code: str):
+        """并发请求组合持仓 (current.json) 和净值 (quote.json)，返回两者的 JSON"""
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            future_qt = executor.submit(self._fetch_portfolio_quotes, [portfolio_code])
+            rebalance_info = self._fetch_current_rebalance(portfolio_code)
+            return rebalance_info, future_qt.result()
+    
+    def _fetch_current_rebalance(self, portfolio_code: str) -> dict:
+        params = {"cube_symbol": portfolio_code}
+        return self.session.get(self.config["portfolio_url_new"], params=params).json()
+    
+    def _fetch_portfolio_quotes(self, portfolio_codes: list) -> dict:
+        """一次 quote.json 请求查询多个组合的净值，返回 {组合代码: 行情}"""
+        params = {"code": ",".join(portfolio_codes)}
+        return self.session.get(self.config["portfolio_quote"], params=params).json()
+    
+    def get_snapshot(self, max_age: float = None) -> PortfolioSnapshot:
+        """
+        获取组合快照
+        
+        :param max_age: 可复用的快照最长存在时间（秒），默认使用 self.snapshot_max_age，0 表示重新获取
+        """
+        if max_age is None:
+            max_age = self.snapshot_max_age
+        snapshot = self._snapshot
+        if max_age and snapshot is not None and snapshot.age() < max_age:
+            return snapshot
+        return self.refresh()
+    
+    def refresh(self) -> PortfolioSnapshot:
+        """重新获取组合快照"""
+        portfolio_code = self.account_config["portfolio_code"]
+        self._snapshot = PortfolioSnapshot.from_info(portfolio_code, self._get_portfolio_info(portfolio_code))
+        return self._snapshot
+    
+    def _balance_of(self, snapshot: PortfolioSnapshot) -> dict:
+        asset_balance = self._virtual_to_balance(snapshot.net_value)
+        cash = asset_balance * snapshot.cash / 100
         market = asset_balance - cash
-        return [{"asset_balance": asset_balance, "current_balance": cash, "enable_balance": cash, "market_value": market, "money_type": "人民币", "pre_interest": 0.25}]
+        return {"asset_balance": asset_balance, "current_balance": cash, "enable_balance": cash, "market_value": market, "money_type": "人民币", "pre_interest": 0.25}
+    
+    def get_balance(self, snapshot: PortfolioSnapshot = None) -> list:
+        return [self._balance_of(snapshot or self.get_snapshot())]
     
     @property
     def cash_weight(self) -> float:
-        portfolio_code = self.account_config.get("portfolio_code")
-        portfolio_info = self._get_portfolio_info(portfolio_code)
-        return float(portfolio_info["last_rb"]["cash"])
+        return self.get_snapshot().cash
     
-    def _get_position(self) -> list:
-        portfolio_code = self.account_config["portfolio_code"]
-        portfolio_info = self._get_portfolio_info(portfolio_code)
-        return portfolio_info["last_rb"]["holdings"]
+    def _get_position(self, snapshot: PortfolioSnapshot = None) -> list:
+        return (snapshot or self.get_snapshot()).positions()
+    
+    @property
+    def position_list(self) -> list:
+        """
+        adjust_weight 使用的持仓列表（调仓请求格式）
+        
+        直接修改列表中的权重后请重新赋值 position_list，以便下次调仓重建索引
+        """
+        return self._position_list
     
-    def get_position(self) -> list:
-        xq_positions = self._get_position()
-        balance = self.get_balance()[0]
+    @position_list.setter
+    def position_list(self, positions: list):
+        self._position_list = positions
+        self._position_book = None
+    
+    def _get_position_book(self) -> PositionBook:
+        """position_list 上的持仓索引，跨多次 adjust_weight(fetch_position=False) 保留，权重合计增量维护"""
+        book = self._position_book
+        if book is None or book.to_list() is not self._position_list or book.is_stale():
+            book = self._position_book = PositionBook(self._position_list)
+        return book
+    
+    def get_position(self, snapshot: PortfolioSnapshot = None) -> list:
+        snapshot = snapshot or self.get_snapshot()
+        balance = self._balance_of(snapshot)
         position_list = []
-        for pos in xq_positions:
+        for pos in snapshot.holdings:
             volume = pos["weight"] * balance["asset_balance"] / 100
             position_list.append({
                 "stock_code": pos["stock_symbol"],
@@ -145,40 +361,28 @@ class XueQiuTrader:
         
         weight = round(weight, 2)
         if fetch_position:
+            # 新快照上只修改一只股票，线性查找一次即可；索引留到 fetch_position=False 的调用再建立
             self.position_list = self._get_position()
-        
-        stock_exists = False
-        for position in self.position_list:
-            if position["stock_id"] == stock["stock_id"]:
-                position["proactive"] = True
-                position["weight"] = weight
-                stock_exists = True
-                break
-        
-        if not stock_exists and weight != 0:
-            self.position_list.append({
-                "code": stock["code"], "name": stock["name"], "flag": stock["flag"],
-                "current": stock["current"], "chg": stock.get("chg", 0),
-                "percent": str(stock.get("percent", 0)), "stock_id": stock["stock_id"],
-                "ind_id": stock.get("ind_id"), "ind_name": stock.get("ind_name", ""),
-                "ind_color": stock.get("ind_color", ""), "textname": stock["name"],
-                "segment_name": stock.get("ind_name", ""), "weight": weight,
-                "url": "/S/" + stock["code"], "proactive": True, "price": str(stock["current"]),
-            })
-        
-        remain_weight = 100 - sum(i.get("weight", 0) for i in self.position_list)
-        cash = round(remain_weight, 2)
-        
-        data = {"cash": cash, "holdings": json.dumps(self.position_list), "cube_symbol": str(self.account_config["portfolio_code"]), "segment": "true", "comment": ""}
-        
-        try:
-            resp = self.session.post(self.config["rebalance_url"], data=data)
-        except Exception as e:
-            return {"error": str(e)}
-        
-        resp_json = resp.json()
-        if "error_description" in resp_json and resp.status_code != 200:
-            return {"error_no": resp_json.get("error_code"), "error_info": resp_json["error_description"]}
+            stock_exists = False
+            for position in self.position_list:
+                if position["stock_id"] == stock["stock_id"]:
+                    position["proactive"] = True
+                    position["weight"] = weight
+                    stock_exists = True
+                    break
+            
+            if not stock_exists and weight != 0:
+                self.position_list.append(self._new_position(stock, weight))
+            error = self._submit_rebalance(self.position_list)
+        else:
+            book = self._get_position_book()
+            if stock["stock_id"] in book:
+                book.set_weight(stock["stock_id"], weight)
+            elif weight != 0:
+                book.add(self._new_position(stock, weight), weight)
+            error = self._submit_rebalance(book.to_list(), book.cash)
+        if error:
+            return error
         
         logger.info("调仓成功 %s: %.2f%%", stock["name"], weight)
         return None
@@ -191,7 +395,8 @@ class XueQiuTrader:
     
     def _trade(self, security: str, price: float = 0, amount: int = 0, volume: float = 0, entrust_bs: str = "buy"):
         stock = self._search_stock_info(security)
-        balance = self.get_balance()[0]
+        snapshot = self.get_snapshot()
+        balance = self._balance_of(snapshot)
         if stock is None:
             raise TradeError("没有查询到股票信息")
         if not volume:
@@ -205,7 +410,7 @@ class XueQiuTrader:
         
         weight = volume / balance["asset_balance"] * 100
         weight = round(weight, 2)
-        position_list = self._get_position()
+        position_list = snapshot.positions()
         
         is_have = False
         for position in position_list:
@@ -223,20 +428,91 @@ class XueQiuTrader:
         
         if not is_have:
             if entrust_bs == "buy":
-                position_list.append({
-                    "code": stock["code"], "name": stock["name"], "flag": stock["flag"],
-                    "current": stock["current"], "chg": stock.get("chg", 0),
-                    "percent": str(stock.get("percent", 0)), "stock_id": stock["stock_id"],
-                    "ind_id": stock.get("ind_id"), "ind_name": stock.get("ind_name", ""),
-                    "ind_color": stock.get("ind_color", ""), "textname": stock["name"],
-                    "segment_name": stock.get("ind_name", ""), "weight": weight,
-                    "url": "/S/" + stock["code"], "proactive": True, "price": str(stock["current"]),
-                })
+                position_list.append(self._new_position(stock, weight))
             else:
                 raise TradeError("没有该股票")
         
-        remain_weight = 100 - sum(i.get("weight", 0) for i in position_list)
-        cash = round(remain_weight, 2)
+        error = self._submit_rebalance(position_list)
+        if error:
+            return error
+        
+        logger.info("%s成功: %.2f", "买入" if entrust_bs == "buy" else "卖出", volume)
+        return None
+    
+    def rebalance_to(self, target_weights: dict, keep_others: bool = False):
+        """
+        一次调整到目标权重
+        
+        在本地组装完整持仓后只提交一次调仓，组合历史中只产生一条调仓记录。
+        已持有的股票直接使用持仓信息，新买入的股票并发搜索。
+        
+        :param target_weights: {股票代码: 目标权重(%)}，如 {"SH600000": 20, "SZ000001": 30.5}
+        :param keep_others: 为 True 时不在 target_weights 中的持仓保持原权重，否则清仓
+        :return: None 表示成功，否则为错误信息
+        """
+        targets = {}
+        for code, weight in target_weights.items():
+            weight = round(float(weight), 2)
+            if weight < 0:
+                raise TradeError(f"目标权重不能为负: {code}")
+            targets[str(code).upper()] = weight
+        
+        book = PositionBook.from_snapshot(self.get_snapshot())
+        for position in book:
+            if position.symbol in targets:
+                book.set_weight(position.stock_id, targets[position.symbol])
+            elif not keep_others:
+                book.set_weight(position.stock_id, 0)
+        
+        new_codes = [code for code, weight in targets.items() if book.find(code) is None and weight != 0]
+        stocks = self._search_stocks(new_codes)
+        for code in new_codes:
+            stock = stocks[code]
+            if stock is None:
+                raise TradeError(f"没有查询到股票信息: {code}")
+            if stock.get("flag") != 1:
+                raise TradeError(f"股票无法操作: {code}")
+            book.add(self._new_position(stock, targets[code]), targets[code])
+        
+        if book.weight_total > 100:
+            raise TradeError(f"目标权重合计 {book.weight_total:.2f}% 超过 100%")
+        
+        error = self._submit_rebalance(book.to_list(), book.cash)
+        if error:
+            return error
+        
+        logger.info("调仓成功: %d 只股票, 现金 %.2f%%", sum(1 for p in book if p.weight), book.cash)
+        return None
+    
+    def _search_stocks(self, codes: list) -> dict:
+        """并发搜索多只股票，返回 {股票代码: 股票信息}，没有查询到的为 None"""
+        if not codes:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.PORTFOLIO_MAX_WORKERS, len(codes))) as executor:
+            return dict(zip(codes, executor.map(self._search_stock_info, codes)))
+    
+    @staticmethod
+    def _new_position(stock: dict, weight: float) -> dict:
+        """新买入股票在调仓请求中的持仓格式"""
+        return {
+            "code": stock["code"], "name": stock["name"], "flag": stock["flag"],
+            "current": stock["current"], "chg": stock.get("chg", 0),
+            "percent": str(stock.get("percent", 0)), "stock_id": stock["stock_id"],
+            "ind_id": stock.get("ind_id"), "ind_name": stock.get("ind_name", ""),
+            "ind_color": stock.get("ind_color", ""), "textname": stock["name"],
+            "segment_name": stock.get("ind_name", ""), "weight": weight,
+            "url": "/S/" + stock["code"], "proactive": True, "price": str(stock["current"]),
+        }
+    
+    def _submit_rebalance(self, position_list: list, cash: float = None):
+        """
+        提交完整持仓，剩余权重为现金
+        
+        :param cash: 已知的现金比例（如 PositionBook.cash），不提供时按持仓权重合计计算
+        :return: None 表示成功，否则为错误信息
+        """
+        if cash is None:
+            cash = round(100 - sum(i.get("weight", 0) for i in position_list), 2)
         data = {"cash": cash, "holdings": json.dumps(position_list), "cube_symbol": str(self.account_config["portfolio_code"]), "segment": "true", "comment": ""}
         
         try:
@@ -248,7 +524,8 @@ class XueQiuTrader:
         if "error_description" in resp_json and resp.status_code != 200:
             return {"error_no": resp_json.get("error_code"), "error_info": resp_json["error_description"]}
         
-        logger.info("%s成功: %.2f", "买入" if entrust_bs == "buy" else "卖出", volume)
+        # 组合已调仓，旧快照失效
+        self._snapshot = None
         return None
     
     def get_history(self, count: int = 20) -> list:
@@ -256,6 +533,24 @@ class XueQiuTrader:
         resp = self.session.get(self.config["history_url"], params=params)
         return resp.json().get("list", [])
     
+    def iter_history(self, page_size: int = 20, cursor: tuple = None, prefetch: bool = True) -> PageIterator:
+        """
+        按页惰性读取组合全部调仓历史（从新到旧），内存中只保留当前页和预取的下一页
+        
+        :param page_size: 每页记录数
+        :param cursor: 从上次迭代器的 cursor 处继续读取
+        :param prefetch: 是否在后台预取下一页
+        :return: PageIterator
+        """
+        cube_symbol = str(self.account_config["portfolio_code"])
+        
+        def fetch_page(page, size):
+            params = {"cube_symbol": cube_symbol, "count": size, "page": page}
+            return self.session.get(self.config["history_url"], params=params).json().get("list", [])
+        
+        return PageIterator(fetch_page, page_size=page_size, cursor=cursor, prefetch=prefetch,
+                            key=lambda record: record.get("id"))
+    
     def get_followed_portfolios(self) -> list:
         """
         获取自选中关注的组合代码列表
@@ -303,21 +598,101 @@ class XueQiuTrader:
     
     def get_public_portfolio(self, portfolio_code: str) -> dict:
         """获取任意公开组合的持仓信息"""
+        return self.get_public_portfolios([portfolio_code]).get(portfolio_code, {})
+    
+    def get_public_portfolios(self, portfolio_codes: list) -> dict:
+        """
+        批量获取公开组合的持仓信息
+        
+        净值通过 quote.json 按 QUOTE_BATCH_SIZE 个组合一批查询，与各组合的 current.json 请求并发进行
+        
+        :param portfolio_codes: 组合代码列表
+        :return: {组合代码: 持仓信息}，获取失败的组合为空字典
+        """
+        codes = list(dict.fromkeys(portfolio_codes))
+        portfolios = dict(self.iter_public_portfolios(codes, max_workers=self.PORTFOLIO_MAX_WORKERS))
+        return {code: portfolios[code] for code in codes}
+    
+    def iter_public_portfolios(self, portfolio_codes: list, max_workers: int = None):
+        """
+        并发扫描公开组合，按完成顺序逐个返回
+        
+        净值按 QUOTE_BATCH_SIZE 个组合一批先行查询，current.json 由最多 max_workers 个线程并发请求；
+        所有请求都经过会话的限流器，扫描速度不会超过 "current" 接口和全局预算。
+        中途停止迭代时，尚未开始的请求会被取消。
+        
+        :param portfolio_codes: 组合代码列表
+        :param max_workers: 同时在途的请求数，默认 SCAN_MAX_WORKERS
+        :return: 生成器，产生 (组合代码, 持仓信息)，获取失败的组合持仓信息为空字典
+        """
+        codes = list(dict.fromkeys(portfolio_codes))
+        if not codes:
+            return
+        batches = [codes[i:i + self.QUOTE_BATCH_SIZE] for i in range(0, len(codes), self.QUOTE_BATCH_SIZE)]
+        
+        def fetch_current(code):
+            try:
+                return self._fetch_current_rebalance(code)
+            except Exception as e:
+                logger.error("获取公开组合失败 %s: %s", code, e)
+                return None
+        
+        def fetch_quotes(batch):
+            try:
+                return self._fetch_portfolio_quotes(batch)
+            except Exception as e:
+                logger.error("获取组合净值失败: %s", e)
+                return {}
+        
+        workers = min(max_workers or self.SCAN_MAX_WORKERS, len(codes) + len(batches))
+        executor = ThreadPoolExecutor(max_workers=workers)
+        futures = []
         try:
-            params = {"cube_symbol": portfolio_code}
-            resp = self.session.get(self.config["portfolio_url_new"], params=params)
-            info = resp.json()
-            params_qt = {"code": portfolio_code}
-            resp_qt = self.session.get(self.config["portfolio_quote"], params=params_qt)
-            quote = resp_qt.json()
-            holdings = info.get("last_rb", {}).get("holdings", [])
-            net_value = quote.get(portfolio_code, {}).get("net_value", 1.0)
-            return {
-                "portfolio_code": portfolio_code,
-                "net_value": net_value,
-                "cash": info.get("last_rb", {}).get("cash", 0),
-                "holdings": [{"symbol": h.get("stock_symbol", ""), "name": h.get("stock_name", ""), "weight": h.get("weight", 0)} for h in holdings]
-            }
-        except Exception as e:
-            logger.error("获取公开组合失败: %s", e)
-            return {}
+            # 净值批次先提交，组合持仓返回时对应批次通常已经完成
+            quote_of = {}
+            for batch in batches:
+                future = executor.submit(fetch_quotes, batch)
+                futures.append(future)
+                for code in batch:
+                    quote_of[code] = future
+            code_of = {}
+            for code in codes:
+                future = executor.submit(fetch_current, code)
+                futures.append(future)
+                code_of[future] = code
+            
+            for future in as_completed(code_of):
+                code = code_of[future]
+                info = future.result()
+                if info is None:
+                    yield code, {}
+                    continue
+                try:
+                    portfolio = self._public_portfolio(code, info, quote_of[code].result())
+                except Exception as e:
+                    logger.error("解析公开组合失败 %s: %s", code, e)
+                    portfolio = {}
+                yield code, portfolio
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+    
+    def scan_followed_portfolios(self, max_workers: int = None):
+        """
+        扫描自选中关注的全部组合，按完成顺序逐个返回
+        
+        :return: 生成器，产生 (组合代码, 持仓信息)，见 iter_public_portfolios
+        """
+        return self.iter_public_portfolios(self.get_followed_portfolios(), max_workers=max_workers)
+    
+    @staticmethod
+    def _public_portfolio(code: str, info: dict, quotes: dict) -> dict:
+        # 新建或清空的组合 last_rb / holdings 可能为 null
+        last_rb = info.get("last_rb") or {}
+        return {
+            "portfolio_code": code,
+            "net_value": (quotes.get(code) or {}).get("net_value", 1.0),
+            "cash": last_rb.get("cash", 0),
+            "holdings": [{"symbol": h.get("stock_symbol", ""), "name": h.get("stock_name", ""), "weight": h.get("weight", 0)} for h in last_rb.get("holdings") or []]
+        }